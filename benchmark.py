@@ -0,0 +1,325 @@
+"""Offline benchmarks for the TGStat parser.
+
+Replays the pages in benchmarks/fixtures from a local stand-in server and
+times each stage at a range of channel counts:
+
+    python benchmark.py                                  # 1k, 10k and 100k channels
+    python benchmark.py --sizes 1000 --save-baseline benchmarks/baseline.json
+    python benchmark.py --baseline benchmarks/baseline.json --tolerance 0.25
+
+With --baseline the exit status is 1 when any stage's throughput drops more
+than --tolerance below the recorded one.
+"""
+import argparse
+import http.server
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.parse
+
+import main
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'fixtures')
+HTML_FIXTURES = {
+    'cards': 'card_page.html',
+    'links': 'link_page.html',
+    'text': 'text_page.html',
+}
+API_FIXTURE = 'api_page.json'
+CHANNELS_PER_PAGE = 20
+PAGE_TOKEN = b'__PAGE__'
+STREAM_CHUNK = 65536
+EMPTY_PAGE = b'<!DOCTYPE html><html><body><div class="row"></div></body></html>'
+# Stages faster than this are mostly timer noise and aren't checked against the baseline.
+MIN_COMPARE_SECONDS = 0.005
+
+
+def load_fixtures():
+    fixtures = {}
+    for kind, name in HTML_FIXTURES.items():
+        with open(os.path.join(FIXTURES, name), 'rb') as f:
+            fixtures[kind] = f.read()
+    with open(os.path.join(FIXTURES, API_FIXTURE), 'rb') as f:
+        fixtures['api'] = f.read()
+    return fixtures
+
+
+def render(template, page, last=False):
+    # Every page gets its own usernames, so run-wide dedup doesn't swallow them.
+    content = template.replace(PAGE_TOKEN, str(page).encode('ascii'))
+    if last:
+        content = content.replace(b'"has_next": true', b'"has_next": false')
+    return content
+
+
+class ReplayHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        parsed = urllib.parse.urlparse(self.path)
+        kind = parsed.path.rstrip('/').split('/')[-1]
+        page = int(urllib.parse.parse_qs(parsed.query).get('page', ['1'])[0])
+
+        with server.lock:
+            server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+
+        if parsed.path.startswith('/channels/list/'):
+            if kind != 'api' or page > server.pages:
+                self.reply(404, b'{"error": "not found"}', 'application/json')
+                return
+            body = render(server.fixtures['api'], page, last=page == server.pages)
+            self.reply(200, body, 'application/json')
+        elif kind in HTML_FIXTURES and page <= server.pages:
+            self.reply(200, render(server.fixtures[kind], page), 'text/html; charset=utf-8')
+        else:
+            self.reply(200, EMPTY_PAGE, 'text/html; charset=utf-8')
+
+    def reply(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ReplayServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, fixtures, pages, latency=0.0):
+        super().__init__(('127.0.0.1', 0), ReplayHandler)
+        self.fixtures = fixtures
+        self.pages = pages
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def measure(fn, repeat, memory):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return best, peak, result
+
+
+def stage_result(stage, size, seconds, peak, pages, channels):
+    return {
+        'stage': stage,
+        'size': size,
+        'seconds': seconds,
+        'pages': pages,
+        'channels': channels,
+        'pages_per_s': pages / seconds if pages and seconds else None,
+        'channels_per_s': channels / seconds if seconds else None,
+        'peak_mb': peak / 2 ** 20 if peak is not None else None,
+    }
+
+
+def bench_size(fixtures, size, repeat, memory, workdir):
+    results = []
+    pages = max(1, size // CHANNELS_PER_PAGE)
+    base_url = 'https://tgstat.ru/ru/tag/bench'
+
+    for kind in HTML_FIXTURES:
+        contents = [render(fixtures[kind], page) for page in range(1, pages + 1)]
+
+        def parse_all():
+            channels = []
+            for content in contents:
+                channels.extend(main.parse_page(content, base_url)[0])
+            return channels
+
+        seconds, peak, channels = measure(parse_all, repeat, memory)
+        results.append(stage_result(f'parse_{kind}', size, seconds, peak, pages, len(channels)))
+
+        def stream_all():
+            # The --incremental path, fed in the chunk size the downloader reads.
+            channels = []
+            for content in contents:
+                page_parser = main.IncrementalPageParser(base_url)
+                for offset in range(0, len(content), STREAM_CHUNK):
+                    page_parser.feed_bytes(content[offset:offset + STREAM_CHUNK])
+                channels.extend(page_parser.finish()[0])
+            return channels
+
+        seconds, peak, channels = measure(stream_all, repeat, memory)
+        results.append(stage_result(f'stream_{kind}', size, seconds, peak, pages, len(channels)))
+
+    api_contents = [render(fixtures['api'], page) for page in range(1, pages + 1)]
+
+    def extract_all():
+        channels = []
+        for content in api_contents:
+            channels.extend(main.extract_api_links(json.loads(content)))
+        return channels
+
+    seconds, peak, channels = measure(extract_all, repeat, memory)
+    results.append(stage_result('extract_api', size, seconds, peak, pages, len(channels)))
+
+    parser = main.TGStatCmdParser()
+    parser.quiet = True
+    parser.output_path = os.path.join(workdir, f'bench_{size}.csv')
+
+    seconds, peak, scores = measure(lambda: parser.score_channels(channels), repeat, memory)
+    results.append(stage_result('score', size, seconds, peak, 0, len(channels)))
+
+    seconds, peak, order = measure(lambda: main.rank_order(scores), repeat, memory)
+    results.append(stage_result('rank', size, seconds, peak, 0, len(channels)))
+
+    ranked = [channels[i] for i in order]
+    seconds, peak, _ = measure(lambda: parser.save_to_csv(ranked), repeat, memory)
+    results.append(stage_result('csv', size, seconds, peak, 0, len(ranked)))
+
+    return results
+
+
+def bench_crawl(fixtures, pages, latency, concurrency, rate, workdir):
+    server = ReplayServer(fixtures, pages, latency).start()
+    try:
+        urls = [f"{server.base_url}/ru/tag/{kind}" for kind in list(HTML_FIXTURES) + ['api']]
+        start = time.perf_counter()
+        ranked = main.crawl(
+            urls,
+            max_pages=pages + 1,
+            api_base=server.base_url,
+            cache='off',
+            concurrency=concurrency,
+            global_rate=rate,
+            host_rate=rate,
+            output=os.path.join(workdir, 'bench_crawl.csv'),
+            checkpoint=os.path.join(workdir, 'bench_checkpoint.json'),
+            history=False,
+            enrich_top=0,
+        )
+        seconds = time.perf_counter() - start
+        return stage_result('crawl', len(ranked), seconds, None, server.requests, len(ranked))
+    finally:
+        server.stop()
+
+
+def print_results(results):
+    print(f"{'stage':<14}{'channels':>10}{'seconds':>10}{'pages/s':>12}{'channels/s':>14}{'peak MB':>10}")
+    for result in results:
+        pages_per_s = f"{result['pages_per_s']:.0f}" if result['pages_per_s'] else '-'
+        peak = f"{result['peak_mb']:.1f}" if result['peak_mb'] is not None else '-'
+        print(
+            f"{result['stage']:<14}{result['size']:>10}{result['seconds']:>10.3f}"
+            f"{pages_per_s:>12}{result['channels_per_s']:>14.0f}{peak:>10}"
+        )
+
+
+def regressions(results, baseline, tolerance):
+    recorded = {(result['stage'], result['size']): result for result in baseline['results']}
+    failed = []
+    for result in results:
+        previous = recorded.get((result['stage'], result['size']))
+        if not previous or not previous['channels_per_s'] or result['stage'] == 'crawl':
+            continue
+        if max(result['seconds'], previous['seconds']) < MIN_COMPARE_SECONDS:
+            continue
+
+        ratio = result['channels_per_s'] / previous['channels_per_s']
+        if ratio < 1 - tolerance:
+            failed.append((result['stage'], result['size'], ratio))
+    return failed
+
+
+def main_benchmark(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Offline benchmarks for the TGStat parser")
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help="channel counts to benchmark (default: 1000 10000 100000)")
+    arg_parser.add_argument('--repeat', type=int, default=3, help="runs per stage, the fastest is kept (default: 3)")
+    arg_parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc peak memory pass")
+    arg_parser.add_argument('--crawl-pages', type=int, default=25,
+                            help="pages per category for the end-to-end crawl, 0 skips it (default: 25)")
+    arg_parser.add_argument('--latency', type=float, default=0.01,
+                            help="stand-in server latency per request in seconds (default: 0.01)")
+    arg_parser.add_argument('--concurrency', type=int, default=4, help="concurrent requests for the crawl (default: 4)")
+    arg_parser.add_argument('--rate', type=float, default=1000,
+                            help="crawl rate limit in requests/s, high by default so the parser is measured (default: 1000)")
+    arg_parser.add_argument('--json', help="write results to this JSON file")
+    arg_parser.add_argument('--save-baseline', help="write results as a baseline for later --baseline checks")
+    arg_parser.add_argument('--baseline', help="compare against a saved baseline and fail on regressions")
+    arg_parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="allowed throughput drop against the baseline (default: 0.2)")
+    args = arg_parser.parse_args(argv)
+
+    fixtures = load_fixtures()
+    results = []
+
+    # Lazy imports happen here rather than inside the first timed stage.
+    report = {
+        'python': sys.version.split()[0],
+        'lxml': main.lxml_xpaths() is not None,
+        'numpy': main.optional_import('numpy') is not None,
+        'results': results,
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            results.extend(bench_size(fixtures, size, args.repeat, not args.no_memory, workdir))
+        if args.crawl_pages:
+            results.append(bench_crawl(fixtures, args.crawl_pages, args.latency, args.concurrency, args.rate, workdir))
+
+    print_results(results)
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+        failed = regressions(results, baseline, args.tolerance)
+        for stage, size, ratio in failed:
+            print(f"REGRESSION {stage} at {size} channels: {ratio:.0%} of baseline throughput")
+        if failed:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} of {args.baseline}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_benchmark())
@@ -1,45 +1,2927 @@
-import requests
-from bs4 import BeautifulSoup
 import threading
 import csv
 import os
 import re
 import json
 import time
+import functools
+import importlib
+import sqlite3
+import heapq
+import hashlib
+import queue
+import contextlib
+import collections
+import random
+import codecs
+import html
+from html.parser import HTMLParser
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
 from urllib.parse import urljoin, urlparse
 import sys
-import colorama
-from colorama import Fore, Back, Style
+import argparse
 
-colorama.init()
+
+# requests, bs4, lxml, numpy, colorama and asyncio are imported where they are
+# first needed, so scoring, cache-only and --help runs don't pay for them.
+@functools.lru_cache(maxsize=None)
+def optional_import(name):
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+class LazyColors:
+    def __init__(self, group):
+        self.group = group
+
+    def __getattr__(self, name):
+        import colorama
+        return getattr(getattr(colorama, self.group), name)
+
+
+Fore = LazyColors('Fore')
+Style = LazyColors('Style')
+
+CARD_CLASSES = ["channel-card", "channel-item"]
+CARD_CLASS_SET = frozenset(CARD_CLASSES)
+CARD_MARKERS = (b'channel-card', b'channel-item')
+LINK_MARKERS = (b't.me/', b'telegram.me/', b'/channel/')
+MEMBERS_JUNK = re.compile(r'[^\d.]')
+CHANNEL_URL_PATTERN = re.compile(
+    r'^(?:https?://)?(?:www\.)?(?:t\.me|telegram\.me|telegram\.dog|[^/]+/channel)/(?:s/)?@?'
+    r'((?:joinchat/|c/)?[^/?#]+)',
+    re.IGNORECASE
+)
+TG_LINK_PATTERN = re.compile(rb'(https?://)?(t\.me|telegram\.me)/([a-zA-Z0-9_]+)')
+
+
+def class_test(classes):
+    return ' or '.join(f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')" for name in classes)
+
+
+def card_class(value):
+    # bs4 4.13+ matches a class_ list against the whole attribute value, which
+    # misses multi-class cards such as "card channel-card peer-item-box".
+    return value is not None and not CARD_CLASS_SET.isdisjoint(value.split())
+
+
+@functools.lru_cache(maxsize=None)
+def soup_strainers():
+    from bs4 import SoupStrainer
+    return SoupStrainer(class_=card_class), SoupStrainer('a', href=True)
+
+
+@functools.lru_cache(maxsize=None)
+def lxml_xpaths():
+    if optional_import('lxml.html') is None:
+        return None
+
+    from lxml import etree
+    return {
+        'card': etree.XPath(f"//*[@class][{class_test(CARD_CLASSES)}]"),
+        'fields': {
+            field: etree.XPath(f"(.//*[@class][{class_test(classes)}])[1]")
+            for field, classes in (
+                ('text', ["channel-name", "channel-title"]),
+                ('members', ["channel-members", "members"]),
+                ('description', ["channel-description", "description"]),
+                ('category', ["channel-category", "category"]),
+            )
+        },
+        'card_anchor': etree.XPath("(.//a[@href])[1]"),
+        'anchor': etree.XPath("//a[@href]"),
+        # Same strings BeautifulSoup's get_text() yields: no script/style/template bodies.
+        'text': etree.XPath(".//text()[not(parent::script or parent::style or parent::template)]"),
+    }
+
+
+def parse_page(content, base_url):
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+
+    # Each pass is skipped outright when its markers are absent from the raw
+    # bytes, and only the nodes a pass needs are ever built into a tree.
+    has_cards = any(marker in content for marker in CARD_MARKERS)
+    has_links = any(marker in content for marker in LINK_MARKERS)
+
+    all_links = []
+    card_count = 0
+
+    xpaths = lxml_xpaths() if has_cards or has_links else None
+    if xpaths is not None:
+        all_links, card_count = lxml_extract_links(content, base_url, has_cards, has_links, xpaths)
+    elif has_cards or has_links:
+        from bs4 import BeautifulSoup
+        card_strainer, anchor_strainer = soup_strainers()
+
+        if has_cards:
+            soup = BeautifulSoup(content, 'html.parser', parse_only=card_strainer)
+            channel_cards = soup.find_all(class_=CARD_CLASSES)
+            card_count = len(channel_cards)
+            all_links = links_from_cards(channel_cards)
+
+        if not all_links and has_links:
+            soup = BeautifulSoup(content, 'html.parser', parse_only=anchor_strainer)
+            all_links = links_from_anchors(soup.find_all('a', href=True), base_url)
+
+    if not all_links:
+        all_links = links_from_text(content)
+
+    return unique_links(all_links), card_count
+
+
+def lxml_text(elem, xpaths):
+    return ''.join(part.strip() for part in xpaths['text'](elem))
+
+
+def lxml_extract_links(content, base_url, has_cards, has_links, xpaths):
+    import lxml.html
+    from lxml import etree
+
+    try:
+        try:
+            root = lxml.html.document_fromstring(content.decode('utf-8'))
+        except ValueError:
+            # Not UTF-8, or an <?xml ... encoding=...?> declaration, which lxml
+            # refuses on str input; the bytes carry their own encoding.
+            root = lxml.html.document_fromstring(content)
+    except etree.ParserError:
+        return [], 0
+
+    links = []
+    channel_cards = xpaths['card'](root) if has_cards else []
+
+    for card in channel_cards:
+        a_tags = xpaths['card_anchor'](card)
+        if not a_tags:
+            continue
+
+        href = a_tags[0].get('href', '')
+
+        if '/channel/' in href:
+            channel_name = href.split('/')[-1]
+
+            fields = {}
+            for field, xpath in xpaths['fields'].items():
+                elems = xpath(card)
+                fields[field] = lxml_text(elems[0], xpaths) if elems else None
+
+            links.append(Channel(
+                f"https://t.me/{channel_name}",
+                fields['text'] if fields['text'] is not None else channel_name,
+                members=parse_members(fields['members']) if fields['members'] is not None else None,
+                description=fields['description'] or "",
+                category=fields['category'] or ""
+            ))
+
+    if not links and has_links:
+        for a in xpaths['anchor'](root):
+            href = a.get('href', '')
+
+            if 't.me/' in href or 'telegram.me/' in href:
+                links.append(Channel(href, lxml_text(a, xpaths) or a.get('title', '') or href))
+            elif '/channel/' in href:
+                if href.startswith('/'):
+                    href = urljoin(base_url, href)
+
+                channel_name = href.split('/')[-1]
+                link_text = lxml_text(a, xpaths) or a.get('title', '') or channel_name
+                links.append(Channel(f"https://t.me/{channel_name}", link_text))
+
+    return links, len(channel_cards)
+
+
+def extract_links(soup, base_url):
+    channel_cards = soup.find_all(class_=CARD_CLASSES)
+    all_links = links_from_cards(channel_cards)
+
+    if not all_links:
+        all_links = links_from_anchors(soup.find_all('a', href=True), base_url)
+
+    if not all_links:
+        all_links = links_from_text(str(soup).encode('utf-8'))
+
+    return unique_links(all_links), len(channel_cards)
+
+
+def links_from_cards(channel_cards):
+    links = []
+
+    for card in channel_cards:
+        a_tag = card.find('a', href=True)
+        if not a_tag:
+            continue
+
+        href = a_tag.get('href', '')
+
+        if '/channel/' in href:
+            channel_parts = href.split('/')
+            if len(channel_parts) > 1:
+                channel_name = channel_parts[-1]
+
+                tg_url = f"https://t.me/{channel_name}"
+
+                title_elem = card.find(class_=["channel-name", "channel-title"])
+                title = title_elem.get_text(strip=True) if title_elem else channel_name
+
+                members_elem = card.find(class_=["channel-members", "members"])
+                members = parse_members(members_elem.get_text(strip=True)) if members_elem else None
+
+                desc_elem = card.find(class_=["channel-description", "description"])
+                description = desc_elem.get_text(strip=True) if desc_elem else ""
+
+                cat_elem = card.find(class_=["channel-category", "category"])
+                category = cat_elem.get_text(strip=True) if cat_elem else ""
+
+                links.append(Channel(tg_url, title, members=members, description=description, category=category))
+
+    return links
+
+
+def links_from_anchors(a_tags, base_url):
+    links = []
+
+    for a in a_tags:
+        href = a.get('href', '')
+
+        if 't.me/' in href or 'telegram.me/' in href:
+            link_text = a.get_text(strip=True)
+            if not link_text:
+                link_text = a.get('title', '') or href
+
+            links.append(Channel(href, link_text))
+        elif '/channel/' in href:
+            if href.startswith('/'):
+                href = urljoin(base_url, href)
+
+            channel_parts = href.split('/')
+            if len(channel_parts) > 1:
+                channel_name = channel_parts[-1]
+                tg_url = f"https://t.me/{channel_name}"
+
+                link_text = a.get_text(strip=True)
+                if not link_text:
+                    link_text = a.get('title', '') or channel_name
+
+                links.append(Channel(tg_url, link_text))
+
+    return links
+
+
+def links_from_text(content):
+    links = []
+    seen_urls = set()
+
+    for match in TG_LINK_PATTERN.finditer(content):
+        protocol, domain, username = (part.decode('ascii') if part else '' for part in match.groups())
+        if not protocol:
+            protocol = "https://"
+
+        full_url = f"{protocol}{domain}/{username}"
+
+        if full_url not in seen_urls:
+            seen_urls.add(full_url)
+            links.append(Channel(full_url, f"@{username}"))
+
+    return links
+
+
+VOID_ELEMENTS = frozenset((
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track', 'wbr'
+))
+RAW_TEXT_ELEMENTS = frozenset(('script', 'style', 'template'))
+CARD_FIELDS = (
+    ('title', frozenset(("channel-name", "channel-title"))),
+    ('members', frozenset(("channel-members", "members"))),
+    ('description', frozenset(("channel-description", "description"))),
+    ('category', frozenset(("channel-category", "category"))),
+)
+# Longer than any t.me / telegram.me match, so a link split across two chunks
+# is always seen whole in one of them.
+TEXT_OVERLAP = 128
+CHARSET_PARAM = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.I)
+META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?([\w.:-]+)', re.I)
+META_SNIFF_BYTES = 1024
+
+
+def known_codec(name):
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+
+def declared_charset(content_type):
+    # requests assumes ISO-8859-1 for text/html without a charset; only an explicit one is used.
+    match = CHARSET_PARAM.search(content_type or '')
+    return known_codec(match.group(1)) if match else None
+
+
+def sniff_charset(chunk):
+    match = META_CHARSET.search(chunk[:META_SNIFF_BYTES])
+    return (known_codec(match.group(1).decode('ascii')) if match else None) or 'utf-8'
+
+
+class IncrementalPageParser(HTMLParser):
+    # Event-driven counterpart of parse_page for pages read in chunks. A card
+    # becomes a Channel as soon as its closing tag arrives and nothing else about
+    # it is kept; anchor and plain-text links are only collected while no card
+    # has produced a link, since parse_page ignores them in that case.
+
+    def __init__(self, base_url, encoding=None):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.encoding = encoding
+        self.decoder = None
+        self.stack = []
+        self.raw_depth = 0
+        self.cdata_skip = None
+        self.cdata_tail = ''
+        self.pending_text = []
+        self.card = None
+        self.anchor = None
+        self.card_count = 0
+        self.card_links = []
+        self.anchor_links = []
+        self.text_links = []
+        self.text_seen = set()
+        self.tail = b''
+        self.skip = 0
+
+    def feed_bytes(self, chunk, final=False):
+        if self.decoder is None:
+            # Without a charset header the first chunk's <meta charset> decides, else UTF-8.
+            self.decoder = codecs.getincrementaldecoder(self.encoding or sniff_charset(chunk))(errors='replace')
+        if not self.card_links and not self.anchor_links:
+            self.scan_text(chunk, final)
+        text = self.decoder.decode(chunk, final)
+        if self.cdata_skip is not None:
+            text = self.skip_cdata(text)
+
+        while text:
+            self.feed(text)
+            text = ''
+            if self.cdata_skip is not None:
+                # html.parser holds a whole <script> or <style> body until its end
+                # tag arrives. Their contents are never used, so they're taken back
+                # and dropped instead.
+                held, self.rawdata = self.rawdata, ''
+                text = self.skip_cdata(held)
+
+    def skip_cdata(self, text):
+        seen = self.cdata_tail + text
+        end = seen.lower().find('</' + self.cdata_skip)
+        if end < 0:
+            self.cdata_tail = seen[-len(self.cdata_skip) - 1:]
+            return ''
+
+        self.cdata_skip = None
+        self.cdata_tail = ''
+        return seen[end:]
+
+    def finish(self):
+        self.feed_bytes(b'', final=True)
+        self.close()
+        self.flush_text()
+        links = self.card_links or self.anchor_links or self.text_links
+        return unique_links(links), self.card_count
+
+    def scan_text(self, chunk, final):
+        buffer = self.tail + chunk
+        cut = len(buffer) if final else max(0, len(buffer) - TEXT_OVERLAP)
+        last_end = 0
+
+        for match in TG_LINK_PATTERN.finditer(buffer, self.skip):
+            if match.start() >= cut:
+                break
+            last_end = match.end()
+
+            protocol, domain, username = (part.decode('ascii') if part else '' for part in match.groups())
+            full_url = f"{protocol or 'https://'}{domain}/{username}"
+            if full_url not in self.text_seen:
+                self.text_seen.add(full_url)
+                self.text_links.append(Channel(full_url, f"@{username}"))
+
+        # A match accepted here may reach into the overlap; don't find its tail again.
+        self.skip = max(0, last_end - cut)
+        self.tail = buffer[cut:]
+
+    def handle_starttag(self, tag, attrs):
+        self.flush_text()
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        void = tag in VOID_ELEMENTS
+        if not void:
+            self.stack.append(tag)
+            if tag in RAW_TEXT_ELEMENTS:
+                self.raw_depth += 1
+            if tag in self.CDATA_CONTENT_ELEMENTS:
+                self.cdata_skip = tag
+        depth = len(self.stack)
+
+        card = self.card
+        if card is None:
+            if not void and any(name in CARD_CLASSES for name in classes):
+                self.card = {'depth': depth, 'href': None, 'fields': {}, 'open': {}}
+                self.card_count += 1
+        else:
+            if tag == 'a' and card['href'] is None and 'href' in attrs:
+                card['href'] = attrs['href'] or ''
+            for field, names in CARD_FIELDS:
+                if field not in card['fields'] and any(name in names for name in classes):
+                    card['fields'][field] = []
+                    if not void:
+                        card['open'][field] = depth
+
+        if tag == 'a' and 'href' in attrs and self.anchor is None and not self.card_links:
+            self.anchor = {'depth': depth, 'href': attrs['href'] or '', 'title': attrs.get('title') or '', 'text': []}
+
+    def handle_endtag(self, tag):
+        self.flush_text()
+        if tag not in self.stack:
+            return
+
+        # Unclosed children are closed along with their parent, as a tree builder would.
+        while self.stack:
+            depth = len(self.stack)
+            closed = self.stack.pop()
+            if closed in RAW_TEXT_ELEMENTS:
+                self.raw_depth -= 1
+            if closed == self.cdata_skip:
+                self.cdata_skip = None
+            self.close_element(depth)
+            if closed == tag:
+                break
+
+    def handle_data(self, data):
+        # Text can arrive in pieces split at chunk boundaries; it's only
+        # stripped once the whole run up to the next tag is in.
+        if not self.raw_depth and (self.card is not None or self.anchor is not None):
+            self.pending_text.append(data)
+
+    def flush_text(self):
+        text = ''.join(self.pending_text).strip()
+        self.pending_text = []
+        if not text:
+            return
+
+        if self.card is not None:
+            for field in self.card['open']:
+                self.card['fields'][field].append(text)
+        if self.anchor is not None:
+            self.anchor['text'].append(text)
+
+    def close_element(self, depth):
+        card = self.card
+        if card is not None:
+            for field, field_depth in list(card['open'].items()):
+                if field_depth == depth:
+                    del card['open'][field]
+            if card['depth'] == depth:
+                self.card = None
+                self.add_card(card)
+
+        anchor = self.anchor
+        if anchor is not None and anchor['depth'] == depth:
+            self.anchor = None
+            if not self.card_links:
+                self.add_anchor(anchor)
+
+    def add_card(self, card):
+        href = card['href']
+        if not href or '/channel/' not in href:
+            return
+
+        channel_name = href.split('/')[-1]
+        fields = {field: ''.join(parts) for field, parts in card['fields'].items()}
+        members = fields.get('members')
+        self.card_links.append(Channel(
+            f"https://t.me/{channel_name}",
+            fields.get('title', channel_name),
+            members=parse_members(members) if members is not None else None,
+            description=fields.get('description', ""),
+            category=fields.get('category', ""),
+        ))
+        self.anchor_links = []
+        self.text_links = []
+        self.text_seen.clear()
+
+    def add_anchor(self, anchor):
+        href = anchor['href']
+        link_text = ''.join(anchor['text'])
+
+        if 't.me/' in href or 'telegram.me/' in href:
+            self.anchor_links.append(Channel(href, link_text or anchor['title'] or href))
+        elif '/channel/' in href:
+            if href.startswith('/'):
+                href = urljoin(self.base_url, href)
+            channel_name = href.split('/')[-1]
+            self.anchor_links.append(Channel(f"https://t.me/{channel_name}", link_text or anchor['title'] or channel_name))
+        else:
+            return
+
+        self.text_links = []
+        self.text_seen.clear()
+
+
+def canonical_username(url):
+    # t.me/x, https://telegram.me/X and tgstat.ru/channel/@x all name the same channel.
+    match = CHANNEL_URL_PATTERN.match(url.strip())
+    if match:
+        name = match.group(1)
+        prefix, _, rest = name.partition('/')
+        # Invite hashes are case-sensitive, and t.me/joinchat/H is the older form of t.me/+H.
+        if name.startswith('+'):
+            return name
+        if rest and prefix.casefold() == 'joinchat':
+            return '+' + rest
+        if rest and prefix.casefold() == 'c':
+            return 'c/' + rest
+        if name.casefold() != 'share':
+            return name.casefold()
+    return url.strip().split('://', 1)[-1].rstrip('/').casefold()
+
+
+def page_fingerprint(links):
+    digest = hashlib.blake2b(digest_size=16)
+    for link in links:
+        digest.update(link.username().encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def unique_links(links):
+    unique = []
+    seen_urls = set()
+
+    for link in links:
+        url = link.url
+        if url not in seen_urls:
+            seen_urls.add(url)
+            unique.append(link)
+
+    return unique
+
+
+# MinHash over character shingles of title + description. Multipliers stay below
+# 2**32 so a * hash + b fits in 64 bits for the NumPy path. 16 bands of 8 rows
+# make pairs above ~0.7 similarity likely to share a bucket.
+DEDUP_PERMUTATIONS = 128
+DEDUP_BANDS = 16
+DEDUP_SHINGLE = 4
+DEDUP_MIN_CHARS = 16
+DEDUP_MIN_DESCRIPTION = 24
+DEDUP_BUCKET_ROWS = 4
+DEDUP_MAX_CHANNELS = 200000
+# --stream exists to keep memory flat, so it tracks about 36 MB of channels unless told otherwise.
+DEDUP_STREAM_MAX_CHANNELS = 20000
+DEDUP_PRIME = 4294967311
+DEDUP_JUNK = re.compile(r'[\W_]+')
+
+
+def dedup_text(channel):
+    # Anchor-only records carry just their link text, which unrelated channels
+    # share ("Subscribe to channel"), so only described channels are compared.
+    description = DEDUP_JUNK.sub(' ', channel.description.casefold()).strip()
+    if len(description) < DEDUP_MIN_DESCRIPTION:
+        return ''
+    # A bare "@username" title says nothing about the content.
+    title = '' if channel.text.startswith('@') else DEDUP_JUNK.sub(' ', channel.text.casefold()).strip()
+    return f"{title} {description}".strip()
+
+
+def shingle_hashes(text):
+    if len(text) < DEDUP_MIN_CHARS:
+        return None
+    # str hashes are salted per process, which is fine: signatures never outlive a run.
+    return list({hash(text[i:i + DEDUP_SHINGLE]) & 0xFFFFFFFF for i in range(len(text) - DEDUP_SHINGLE + 1)})
+
+
+class NearDuplicates:
+    # Mirror channels share most of their title and description. Signatures are
+    # cut into bands and a channel is only compared with the first few channels
+    # of different clusters in each of its band buckets, so clustering stays
+    # near-linear; clusters are a union-find that remembers the URL and score
+    # of each cluster's best channel, never the Channel itself, so streamed
+    # channels can still be freed. Tracking costs about 2 KB per channel and
+    # stops at max_channels; later channels are treated as unique.
+
+    def __init__(self, threshold=0.8, max_channels=DEDUP_MAX_CHANNELS):
+        from array import array
+
+        self.threshold = threshold
+        self.max_channels = max_channels
+        self.array = array
+        rng = random.Random(DEDUP_PRIME)
+        self.a = [rng.randrange(1, 2 ** 32) for _ in range(DEDUP_PERMUTATIONS)]
+        self.b = [rng.randrange(0, DEDUP_PRIME) for _ in range(DEDUP_PERMUTATIONS)]
+
+        self.np = optional_import('numpy')
+        if self.np is not None:
+            self.a_column = self.np.array(self.a, dtype=self.np.uint64)[:, None]
+            self.b_column = self.np.array(self.b, dtype=self.np.uint64)[:, None]
+
+        # A bucket holds a single row id until a second cluster lands in it.
+        self.buckets = [{} for _ in range(DEDUP_BANDS)]
+        self.signatures = []
+        self.parent = array('I')
+        self.best = {}
+        self.rows = {}
+        self.full = False
+
+    def signature(self, hashes):
+        if self.np is not None:
+            np = self.np
+            values = (self.a_column * np.asarray(hashes, dtype=np.uint64) + self.b_column) % DEDUP_PRIME
+            return values.min(axis=1).astype('<u4').tobytes()
+        return self.array('I', [
+            min((a * value + b) % DEDUP_PRIME for value in hashes) & 0xFFFFFFFF for a, b in zip(self.a, self.b)
+        ]).tobytes()
+
+    def similarity(self, first, second):
+        if self.np is not None:
+            equal = self.np.frombuffer(first, dtype='<u4') == self.np.frombuffer(second, dtype='<u4')
+            return int(equal.sum()) / DEDUP_PERMUTATIONS
+        return sum(x == y for x, y in zip(memoryview(first).cast('I'), memoryview(second).cast('I'))) / DEDUP_PERMUTATIONS
+
+    def find(self, row):
+        while self.parent[row] != row:
+            self.parent[row] = self.parent[self.parent[row]]
+            row = self.parent[row]
+        return row
+
+    def union(self, first, second):
+        first, second = sorted((self.find(first), self.find(second)))
+        if first == second:
+            return
+        self.parent[second] = first
+
+        # Ties go to the channel seen first.
+        best, other = self.best[first], self.best.pop(second)
+        if other[0] > best[0]:
+            self.best[first] = other
+
+    def candidates(self, row, bucket, key):
+        others = bucket.get(key)
+        if others is None:
+            bucket[key] = row
+            return ()
+        if isinstance(others, int):
+            others = bucket[key] = [others]
+        return others
+
+    def add(self, channel):
+        hashes = shingle_hashes(dedup_text(channel))
+        if hashes is None:
+            return
+        if len(self.signatures) >= self.max_channels:
+            self.full = True
+            return
+
+        signature = self.signature(hashes)
+        row = len(self.signatures)
+        self.signatures.append(signature)
+        self.parent.append(row)
+        self.rows[channel.username()] = row
+        self.best[row] = (channel.score or 0, channel.url)
+
+        width = len(signature) // DEDUP_BANDS
+        for band, bucket in enumerate(self.buckets):
+            key = hash(signature[band * width:(band + 1) * width])
+            others = self.candidates(row, bucket, key)
+            matched = not others
+            for other in others:
+                if self.find(other) == self.find(row):
+                    matched = True
+                elif self.similarity(signature, self.signatures[other]) >= self.threshold:
+                    self.union(other, row)
+                    matched = True
+            if not matched and len(others) < DEDUP_BUCKET_ROWS:
+                others.append(row)
+
+    def best_url(self, channel):
+        """URL of the best channel in `channel`'s cluster, None if it isn't tracked."""
+        row = self.rows.get(channel.username())
+        return self.best[self.find(row)][1] if row is not None else None
+
+
+def api_params(page):
+    return {
+        'page': page,
+        'sort': 'members',
+        'extended': 1
+    }
+
+
+def extract_api_links(data):
+    new_links = []
+    for item in data['items']:
+        if 'username' in item and item['username']:
+            username = item['username']
+            title = item.get('title', username)
+            members = item.get('members', 0)
+
+            new_links.append(Channel(
+                f"https://t.me/{username}",
+                title,
+                members=parse_members(members),
+                description=item.get('description', ''),
+                category=item.get('category', ''),
+                avg_post_reach=item.get('avg_post_reach', 0),
+                citations=item.get('citations', 0),
+                source_mode='api'
+            ))
+
+    return new_links
+
+
+STAT_PATTERN = re.compile(
+    rb'class="[^"]*\b(avg-post-reach|post-reach|citations|citation-index|channel-members)\b[^"]*"[^>]*>\s*([^<]*)<'
+)
+STAT_FIELDS = {
+    b'avg-post-reach': 'avg_post_reach',
+    b'post-reach': 'avg_post_reach',
+    b'citations': 'citations',
+    b'citation-index': 'citations',
+    b'channel-members': 'members',
+}
+
+
+def parse_channel_stats(content):
+    stats = {}
+    for name, value in STAT_PATTERN.findall(content):
+        field = STAT_FIELDS[name]
+        if field not in stats:
+            stats[field] = int(parse_members(value.decode('utf-8', 'replace').strip()))
+    return stats
+
+
+def read_urls(value):
+    if os.path.isfile(value):
+        with open(value, encoding='utf-8') as f:
+            entries = [line.strip() for line in f]
+    else:
+        entries = [entry.strip() for entry in value.split(',')]
+
+    return [normalize_url(entry) for entry in entries if entry and not entry.startswith('#')]
+
+
+def normalize_url(url):
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+    return url
+
+
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504, 520, 521, 522, 523, 524))
+
+
+def retry_after(response):
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        from email.utils import parsedate_to_datetime
+
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+def body_chunks(response, max_bytes, chunk_size=65536):
+    # Bodies are counted after decompression, so a small gzip bomb trips the
+    # limit as early as a large plain page.
+    length = response.headers.get('Content-Length')
+    if length and length.isdigit() and int(length) > max_bytes:
+        raise BodyTooLarge(f"{response.url} is {length} bytes, over the {max_bytes} byte limit")
+
+    size = response.body_bytes = 0
+    for chunk in response.iter_content(chunk_size):
+        size += len(chunk)
+        if size > max_bytes:
+            raise BodyTooLarge(f"{response.url} is over the {max_bytes} byte limit")
+        response.body_bytes = size
+        yield chunk
+
+
+def read_body(response, max_bytes):
+    try:
+        response._content = b''.join(body_chunks(response, max_bytes))
+    finally:
+        response.close()
+    response.body_bytes = len(response._content)
+    return response
+
+
+def transport_errors():
+    import requests
+
+    return requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError
+
+
+def retries_exhausted(error):
+    # send_request only retries transport errors and RETRY_STATUSES; anything
+    # else (a 404, BodyTooLarge) failed on the first try.
+    import requests
+
+    if isinstance(error, requests.HTTPError):
+        response = error.response
+        return (response is not None and response.status_code in RETRY_STATUSES
+                and not getattr(response, 'offline_miss', False))
+    return isinstance(error, transport_errors())
+
+
+def backoff_delay(attempt, base, cap):
+    # "Full jitter": workers that failed together don't retry together.
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    # After `threshold` failures in a row a host is paused rather than given up on;
+    # requests to it wait out the pause, and each trip doubles the next one. Keys
+    # are (session, host), so a failing proxy doesn't pause the other sessions.
+    def __init__(self, threshold=5, cooldown=30, max_cooldown=300):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.lock = threading.Lock()
+        self.failures = {}
+        self.open_until = {}
+        self.cooldowns = {}
+
+    def remaining(self, host):
+        with self.lock:
+            return max(0.0, self.open_until.get(host, 0) - time.monotonic())
+
+    def success(self, host):
+        with self.lock:
+            self.failures[host] = 0
+            self.cooldowns.pop(host, None)
+
+    def failure(self, host):
+        with self.lock:
+            self.failures[host] = self.failures.get(host, 0) + 1
+            if self.failures[host] < self.threshold:
+                return None
+
+            cooldown = self.cooldowns.get(host, self.cooldown)
+            self.open_until[host] = time.monotonic() + cooldown
+            self.cooldowns[host] = min(cooldown * 2, self.max_cooldown)
+            self.failures[host] = 0
+            return cooldown
+
+
+class TokenBucket:
+    # Thread-side counterpart of RateLimiter: `burst` requests may go at once,
+    # then `rate` per second. A rate of 0 means unlimited. Callers hold the
+    # owning pool's lock.
+    def __init__(self, rate, burst=1):
+        self.rate = rate or 0
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def delay(self, now):
+        if not self.rate:
+            return 0.0
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        if self.rate:
+            self.tokens -= 1
+
+
+class PooledSession:
+    def __init__(self, name, session, rate=0, endpoint_rates=None):
+        self.name = name
+        self.session = session
+        self.bucket = TokenBucket(rate)
+        self.endpoint_buckets = {endpoint: TokenBucket(rate) for endpoint, rate in (endpoint_rates or {}).items()}
+        self.hold_until = 0.0
+        self.in_flight = 0
+        self.requests = 0
+
+    def delay(self, endpoint, now):
+        delays = [self.hold_until - now, self.bucket.delay(now)]
+        if endpoint in self.endpoint_buckets:
+            delays.append(self.endpoint_buckets[endpoint].delay(now))
+        return max(delays)
+
+    def take(self, endpoint):
+        self.bucket.take()
+        if endpoint in self.endpoint_buckets:
+            self.endpoint_buckets[endpoint].take()
+        self.in_flight += 1
+        self.requests += 1
+
+
+class SessionPool:
+    # Each session is its own client identity (proxy, headers, cookie jar) with
+    # its own token buckets. A request goes to the least-busy session that is
+    # allowed to send now; sessions the breaker has quarantined for a host, or
+    # that are backing off after a failure, are skipped until they recover.
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def acquire(self, host, endpoint, breaker):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                best = None
+                soonest = None
+
+                for pooled in self.sessions:
+                    delay = max(pooled.delay(endpoint, now), breaker.remaining((pooled.name, host)))
+                    if delay > 0:
+                        soonest = delay if soonest is None else min(soonest, delay)
+                    elif best is None or (pooled.in_flight, pooled.requests) < (best.in_flight, best.requests):
+                        best = pooled
+
+                if best is not None:
+                    best.take(endpoint)
+                    return best
+
+            time.sleep(soonest)
+
+    def release(self, pooled):
+        with self.lock:
+            pooled.in_flight -= 1
+
+    def hold(self, pooled, seconds):
+        with self.lock:
+            pooled.hold_until = max(pooled.hold_until, time.monotonic() + seconds)
+
+    def close(self):
+        for pooled in self.sessions:
+            pooled.session.close()
+
+
+class RateLimiter:
+    def __init__(self, rate):
+        import asyncio
+
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_slot = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        import asyncio
+
+        # asyncio.Lock wakes waiters in FIFO order, so callers from different
+        # categories are served round-robin instead of one category hogging slots.
+        async with self.lock:
+            now = time.monotonic()
+            if self.next_slot > now:
+                await asyncio.sleep(self.next_slot - now)
+                now = self.next_slot
+            self.next_slot = now + self.interval
+
+
+class BatchCrawler:
+    def __init__(self, parser, max_pages):
+        import asyncio
+
+        self.parser = parser
+        self.max_pages = max_pages
+
+        self.global_limiter = RateLimiter(parser.global_rate)
+        self.host_limiters = {}
+        self.slots = asyncio.Semaphore(parser.concurrency)
+
+        self.fetch_pool = ThreadPoolExecutor(max_workers=parser.concurrency)
+        if parser.parse_workers > 0:
+            self.parse_pool = ProcessPoolExecutor(max_workers=parser.parse_workers)
+        else:
+            self.parse_pool = self.fetch_pool
+        # Streamed pages are enriched, scored and written one at a time on their own
+        # thread: stat lookups block on HTTP and backoff and mustn't stall the loop.
+        self.store_pool = ThreadPoolExecutor(max_workers=1) if parser.stream is not None else None
+
+    async def run(self, urls):
+        import asyncio
+
+        try:
+            results = await asyncio.gather(*(self.crawl_category(url) for url in urls))
+        finally:
+            self.fetch_pool.shutdown(wait=False, cancel_futures=True)
+            self.parse_pool.shutdown(wait=False, cancel_futures=True)
+            if self.store_pool is not None:
+                self.store_pool.shutdown(wait=False, cancel_futures=True)
+
+        return dict(zip(urls, results))
+
+    async def get(self, url, params=None, endpoint='html'):
+        # Fresh cache hits don't spend rate-limit slots.
+        response = self.parser.cached(url, params, endpoint)
+        if response is not None:
+            self.parser.metrics.observe_request(endpoint, 0, response)
+            return response
+
+        return await self.limited(url, functools.partial(self.parser.fetch, url, params, endpoint))
+
+    async def limited(self, url, request):
+        import asyncio
+
+        host = urlparse(url).netloc
+        if host not in self.host_limiters:
+            # The per-host limit is per client identity, so each pooled session adds to it.
+            self.host_limiters[host] = RateLimiter(self.parser.host_rate * len(self.parser.session_pool))
+
+        async with self.slots:
+            await self.global_limiter.wait()
+            await self.host_limiters[host].wait()
+
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.fetch_pool, request)
+
+    async def crawl_category(self, url):
+        url = normalize_url(url)
+
+        links = []
+        try:
+            mode, start_page = self.parser.resume_point(url)
+
+            if mode == 'api':
+                if await self.crawl_api(url, links, start_page):
+                    return links
+
+                self.parser.print_status(f"[{url}] API failed, switching to regular parsing...", "warning")
+                mode, start_page = 'html', 1
+
+            if mode == 'html':
+                await self.crawl_html(url, links, start_page)
+        except Exception as e:
+            self.parser.print_status(f"[{url}] Error: {str(e)}", "error")
+
+        return links
+
+    async def collect(self, url, new_links, links, mode, page):
+        import asyncio
+
+        source_category = sys.intern(url)
+        for link in new_links:
+            link.source_category = source_category
+
+        if self.store_pool is None:
+            self.store(url, new_links, links, mode, page)
+        else:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.store_pool, self.store, url, new_links, links, mode, page)
+
+    def store(self, url, new_links, links, mode, page):
+        links.extend(self.parser.add_links(new_links, mode))
+        self.parser.mark_progress(url, mode, page, new_links)
+
+    async def crawl_api(self, url, links, start_page=1):
+        api_url = self.parser.api_url(url)
+        current_page = start_page
+
+        while current_page <= self.max_pages and not self.parser.stop_parsing:
+            response = await self.get(api_url, api_params(current_page), 'api')
+
+            # Nothing was sent, so unlike a 504 from the server this isn't an outage.
+            if getattr(response, 'offline_miss', False):
+                self.parser.print_status(f"[{url}] API page {current_page} is not cached (offline mode)", "warning")
+                return False
+
+            # An outage that outlasted the retries isn't a reason to downgrade to HTML;
+            # the category stays unfinished and --resume picks it up at this page.
+            if response.status_code in RETRY_STATUSES:
+                self.parser.print_status(f"[{url}] API still returns {response.status_code} after retries, "
+                                         f"stopping at page {current_page}", "error")
+                return True
+
+            if response.status_code != 200:
+                self.parser.print_status(f"[{url}] API returned error: {response.status_code}", "error")
+                return False
+
+            try:
+                data = response.json()
+            except ValueError:
+                self.parser.print_status(f"[{url}] Failed to parse JSON response from API", "error")
+                return False
+
+            if 'items' not in data:
+                self.parser.print_status(f"[{url}] API returned unexpected data format", "error")
+                return False
+
+            with self.parser.metrics.timer('extract'):
+                new_links = extract_api_links(data)
+
+            if not new_links and current_page > 1:
+                break
+
+            if self.parser.repeated_page(url, 'api', new_links):
+                self.parser.print_status(f"[{url}] API: page {current_page} repeats an earlier page. Finishing.", "info")
+                break
+
+            await self.collect(url, new_links, links, 'api', current_page)
+
+            if not data.get('pagination', {}).get('has_next', True):
+                break
+
+            current_page += 1
+
+        if not self.parser.stop_parsing:
+            self.parser.mark_progress(url, 'done', current_page)
+        return True
+
+    async def crawl_html(self, url, links, start_page=1):
+        import asyncio
+
+        parsed_url = urlparse(url)
+        base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
+        loop = asyncio.get_running_loop()
+        current_page = start_page
+
+        while current_page <= self.max_pages and not self.parser.stop_parsing:
+            page_url = self.parser.page_url(url, current_page)
+            if self.parser.incremental:
+                request = functools.partial(self.parser.parse_streamed, page_url, base_url)
+                new_links, _, parse_seconds = await self.limited(page_url, request)
+            else:
+                response = await self.get(page_url)
+                response.raise_for_status()
+
+                new_links, _, parse_seconds = await loop.run_in_executor(
+                    self.parse_pool, timed_parse_page, response.content, base_url
+                )
+            self.parser.metrics.observe_parse(parse_seconds)
+
+            if not new_links and current_page > 1:
+                break
+
+            if self.parser.repeated_page(url, 'html', new_links):
+                self.parser.print_status(f"[{url}] Page {current_page} repeats an earlier page. Finishing.", "info")
+                break
+
+            await self.collect(url, new_links, links, 'html', current_page)
+
+            current_page += 1
+
+        if not self.parser.stop_parsing:
+            self.parser.mark_progress(url, 'done', current_page)
+
+
+def parse_members(members):
+    if isinstance(members, (int, float)):
+        return members
+    if not isinstance(members, str):
+        return 0
+
+    try:
+        if 'K' in members:
+            return float(members.replace('K', '')) * 1000
+        elif 'M' in members:
+            return float(members.replace('M', '')) * 1000000
+        else:
+            return float(MEMBERS_JUNK.sub('', members))
+    except ValueError:
+        return 0
+
+
+# Each scoring criterion maps to a tier; a channel's analysis is stored as the
+# packed tiers (see pack_reasons) and only rendered to text when displayed.
+AUDIENCE_POINTS = (30, 25, 15, 5)
+AUDIENCE_REASONS = (
+    "Large audience (100K+ subscribers)",
+    "Good size audience (50K+ subscribers)",
+    "Medium size audience (10K+ subscribers)",
+    "Small audience (less than 10K subscribers)",
+)
+ENGAGEMENT_POINTS = (0, 35, 25, 15, 5)
+ENGAGEMENT_REASONS = (
+    None,
+    "Excellent engagement rate ({:.1f}%)",
+    "Very good engagement rate ({:.1f}%)",
+    "Good engagement rate ({:.1f}%)",
+    "Low engagement rate ({:.1f}%)",
+)
+CITATION_POINTS = (0, 20, 15, 10, 5)
+CITATION_REASONS = (
+    None,
+    "Highly cited channel (1000+ citations)",
+    "Well cited channel (500+ citations)",
+    "Moderately cited channel (100+ citations)",
+    "Some citations",
+)
+DESCRIPTION_POINTS = (10, 7, 5, 0)
+DESCRIPTION_REASONS = (
+    "Detailed channel description",
+    "Good channel description",
+    "Basic channel description",
+    "Minimal or no description",
+)
+
+
+MAX_ENRICH_POINTS = max(ENGAGEMENT_POINTS) + max(CITATION_POINTS)
+
+
+def pack_reasons(audience, engagement, citations, description):
+    return audience | engagement << 2 | citations << 5 | description << 8
+
+
+def reasons_text(reasons, engagement_rate):
+    analysis = [AUDIENCE_REASONS[reasons & 0x3]]
+
+    engagement = (reasons >> 2) & 0x7
+    if engagement:
+        analysis.append(ENGAGEMENT_REASONS[engagement].format(engagement_rate))
+
+    citations = (reasons >> 5) & 0x7
+    if citations:
+        analysis.append(CITATION_REASONS[citations])
+
+    analysis.append(DESCRIPTION_REASONS[(reasons >> 8) & 0x3])
+    return analysis
+
+
+def engagement_rate(members, avg_reach):
+    return (avg_reach / members) * 100 if members > 0 else 0
+
+
+def channel_tiers(members, avg_reach, citations, description_length):
+    audience = 0 if members > 100000 else 1 if members > 50000 else 2 if members > 10000 else 3
+
+    engagement = 0
+    if avg_reach > 0:
+        rate = engagement_rate(members, avg_reach)
+        engagement = 1 if rate > 30 else 2 if rate > 20 else 3 if rate > 10 else 4
+
+    citation = 0
+    if citations > 0:
+        citation = 1 if citations > 1000 else 2 if citations > 500 else 3 if citations > 100 else 4
+
+    description = 0 if description_length > 200 else 1 if description_length > 100 else 2 if description_length > 50 else 3
+
+    score = AUDIENCE_POINTS[audience] + ENGAGEMENT_POINTS[engagement] + CITATION_POINTS[citation] + \
+        DESCRIPTION_POINTS[description]
+
+    return min(score, 100), pack_reasons(audience, engagement, citation, description)
+
+
+class Channel:
+    __slots__ = ('url', 'text', 'members', 'description', 'category', 'avg_post_reach', 'citations',
+                 'source_category', 'score', 'reasons', 'duplicate_of', 'source_mode')
+
+    def __init__(self, url, text, members=None, description='', category='', avg_post_reach=0, citations=0,
+                 source_category='', score=None, reasons=None, duplicate_of=None, source_mode='html'):
+        self.url = url
+        self.text = text
+        self.members = int(members) if members is not None else None
+        self.description = description or ''
+        self.category = sys.intern(str(category)) if category else ''
+        self.avg_post_reach = avg_post_reach or 0
+        self.citations = citations or 0
+        self.source_category = sys.intern(source_category) if source_category else ''
+        self.score = score
+        self.reasons = reasons
+        self.duplicate_of = duplicate_of
+        self.source_mode = source_mode
+
+    def __repr__(self):
+        return f"Channel({self.url!r}, {self.text!r}, members={self.members!r})"
+
+    def username(self):
+        return canonical_username(self.url)
+
+    def engagement_rate(self):
+        return engagement_rate(self.members or 0, self.avg_post_reach)
+
+    def analysis(self):
+        return reasons_text(self.reasons, self.engagement_rate())
+
+    def members_label(self):
+        return self.members if self.members is not None else 'Unknown'
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def channel_columns(channels):
+    members = [channel.members or 0 for channel in channels]
+    reach = [channel.avg_post_reach for channel in channels]
+    citations = [channel.citations for channel in channels]
+    description_length = [len(channel.description) for channel in channels]
+    return members, reach, citations, description_length
+
+
+def score_columns(members, reach, citations, description_length):
+    # Same tiers as channel_tiers, evaluated column-wise.
+    np = optional_import('numpy')
+    if np is None:
+        return score_columns_python(members, reach, citations, description_length)
+
+    members = np.asarray(members, dtype=np.float64)
+    reach = np.asarray(reach, dtype=np.float64)
+    citations = np.asarray(citations, dtype=np.float64)
+    description_length = np.asarray(description_length, dtype=np.int64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        engagement = np.where(members > 0, reach / members * 100, 0.0)
+
+    audience_tier = np.select([members > 100000, members > 50000, members > 10000], [0, 1, 2], 3)
+    engagement_tier = np.where(
+        reach > 0, np.select([engagement > 30, engagement > 20, engagement > 10], [1, 2, 3], 4), 0
+    )
+    citation_tier = np.select([citations > 1000, citations > 500, citations > 100, citations > 0], [1, 2, 3, 4], 0)
+    description_tier = np.select(
+        [description_length > 200, description_length > 100, description_length > 50], [0, 1, 2], 3
+    )
+
+    scores = np.take(AUDIENCE_POINTS, audience_tier) + np.take(ENGAGEMENT_POINTS, engagement_tier) + \
+        np.take(CITATION_POINTS, citation_tier) + np.take(DESCRIPTION_POINTS, description_tier)
+    reasons = pack_reasons(audience_tier, engagement_tier, citation_tier, description_tier)
+
+    return np.minimum(scores, 100), reasons, engagement
+
+
+def score_columns_python(members, reach, citations, description_length):
+    scores = []
+    reasons = []
+    engagement = []
+
+    for channel_members, avg_reach, channel_citations, length in zip(members, reach, citations, description_length):
+        score, code = channel_tiers(channel_members, avg_reach, channel_citations, length)
+        scores.append(score)
+        reasons.append(code)
+        engagement.append(engagement_rate(channel_members, avg_reach))
+
+    return scores, reasons, engagement
+
+
+def rank_order(scores):
+    # Descending and stable, like list.sort(reverse=True) on the scores.
+    np = optional_import('numpy')
+    if np is not None:
+        return np.argsort(-np.asarray(scores), kind='stable')
+    return sorted(range(len(scores)), key=scores.__getitem__, reverse=True)
+
+
+CSV_FIELDS = ['url', 'text', 'members', 'description', 'category', 'quality_score', 'analysis', 'source_category',
+              'duplicate_of', 'avg_post_reach', 'citations']
+
+
+def csv_row(channel):
+    return [
+        channel.url,
+        channel.text,
+        channel.members if channel.members is not None else '',
+        channel.description,
+        channel.category,
+        channel.score,
+        '; '.join(channel.analysis()),
+        channel.source_category,
+        channel.duplicate_of or '',
+        channel.avg_post_reach,
+        channel.citations,
+    ]
+
+
+class ScoreHistogram:
+    # Scores are whole points from 0 to 100, so a counter per value is an exact
+    # quantile sketch in constant space; no t-digest approximation is needed.
+    def __init__(self, counts=None, total=0):
+        self.counts = list(counts) if counts else [0] * 101
+        self.count = sum(self.counts)
+        self.total = total
+
+    def add(self, score):
+        self.counts[min(100, max(0, int(round(score))))] += 1
+        self.count += 1
+        self.total += score
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def quantile(self, q):
+        if not self.count:
+            return 0
+
+        target = q * self.count
+        seen = 0
+        for score, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return score
+        return 100
+
+
+class OnlineScores:
+    # Decides during the crawl which channels are worth a notification. Nothing is
+    # sent before `warmup` channels have been seen or while the threshold is still
+    # moving, and a channel has to beat the threshold by `margin` percent; channels
+    # that arrive meanwhile wait in a small pool of the best candidates.
+    def __init__(self, parser, warmup=200, margin=5, window=5, stability=5, pending_limit=100):
+        self.parser = parser
+        self.warmup = warmup
+        self.margin = margin
+        self.stability = stability
+        self.pending_limit = pending_limit
+
+        self.scores = ScoreHistogram()
+        self.thresholds = collections.deque(maxlen=window)
+        self.pending = []
+        self.seq = 0
+
+    def threshold(self):
+        if self.parser.notify_quantile:
+            return self.scores.quantile(self.parser.notify_quantile)
+        return self.scores.mean() * (1 + self.parser.ai_threshold / 100)
+
+    def stable(self):
+        if len(self.thresholds) < self.thresholds.maxlen:
+            return False
+        highest = max(self.thresholds)
+        return highest - min(self.thresholds) <= highest * self.stability / 100
+
+    def bar(self):
+        # The score a channel must beat to be notified, or None until warmed up and settled.
+        if self.scores.count < self.warmup or not self.stable():
+            return None
+        return self.thresholds[-1] * (1 + self.margin / 100)
+
+    def update(self, channels):
+        for channel in channels:
+            self.scores.add(channel.score)
+
+            self.seq += 1
+            entry = (channel.score, -self.seq, channel)
+            if len(self.pending) < self.pending_limit:
+                heapq.heappush(self.pending, entry)
+            elif entry[:2] > self.pending[0][:2]:
+                heapq.heapreplace(self.pending, entry)
+
+        self.thresholds.append(self.threshold())
+        bar = self.bar()
+        if bar is None:
+            return
+
+        ready = [entry for entry in self.pending if entry[0] > bar]
+        if not ready:
+            return
+
+        self.pending = [entry for entry in self.pending if entry[0] <= bar]
+        heapq.heapify(self.pending)
+
+        ready.sort(key=lambda entry: entry[:2], reverse=True)
+        channels = [channel for _, _, channel in ready]
+        previous = self.parser.previous_snapshots(channels)
+        for channel in channels:
+            self.parser.notify_channel(channel, self.scores.mean(), previous)
+
+    def state(self):
+        return {
+            'counts': self.scores.counts,
+            'total': self.scores.total,
+            'thresholds': list(self.thresholds),
+        }
+
+    def restore(self, state):
+        self.scores = ScoreHistogram(state['counts'], state['total'])
+        self.thresholds.extend(state['thresholds'])
+
+
+class ResultStream:
+    def __init__(self, parser, filename, top_k=10, append=False):
+        self.parser = parser
+        self.filename = filename
+        self.top_k = top_k
+
+        self.count = 0
+        self.unique = 0
+        self.total_score = 0
+        self.heap = []
+        self.online = OnlineScores(parser, parser.notify_warmup, parser.notify_margin) if parser.online else None
+
+        append = append and os.path.exists(filename) and os.path.getsize(filename) > 0
+        self.file = open(filename, 'a' if append else 'w', newline='', encoding='utf-8-sig')
+        self.writer = csv.writer(self.file)
+        if not append:
+            self.writer.writerow(CSV_FIELDS)
+            self.file.flush()
+
+    def add(self, channels):
+        # Only channels that could still make the top list are worth enriching.
+        min_score = self.heap[0][0] if len(self.heap) >= self.top_k else -1
+        self.parser.enrich_channels(channels, min_score)
+        self.parser.score_channels(channels)
+        channels = self.parser.mark_duplicates(channels)
+
+        with self.parser.metrics.timer('write'):
+            self.write(channels)
+
+        if self.online is not None:
+            self.online.update([channel for channel in channels if channel.duplicate_of is None])
+
+    def write(self, channels):
+        if self.parser.columnar is not None:
+            self.parser.columnar.add(channels)
+        self.parser.record_history(channels)
+
+        for channel in channels:
+            score = channel.score
+
+            self.writer.writerow(csv_row(channel))
+            self.count += 1
+            if channel.duplicate_of is not None:
+                continue
+
+            self.unique += 1
+            self.total_score += score
+
+            # Min-heap on (score, -seq): among equal scores the earliest channel
+            # survives, the same order a stable descending sort would give.
+            entry = (score, -self.count, channel)
+            if len(self.heap) < self.top_k:
+                heapq.heappush(self.heap, entry)
+            elif entry[:2] > self.heap[0][:2]:
+                heapq.heapreplace(self.heap, entry)
+
+        self.file.flush()
+
+    def average(self):
+        return self.total_score / self.unique if self.unique else 0
+
+    def top(self):
+        # A channel can be outscored by a mirror found after it entered the heap.
+        duplicates = self.parser.duplicates
+        return [
+            channel for _, _, channel in sorted(self.heap, key=lambda entry: entry[:2], reverse=True)
+            if duplicates is None or duplicates.best_url(channel) in (None, channel.url)
+        ]
+
+    def state(self):
+        return {
+            'count': self.count,
+            'unique': self.unique,
+            'total_score': self.total_score,
+            'top': [[score, seq, channel.to_dict()] for score, seq, channel in self.heap],
+            'online': self.online.state() if self.online is not None else None,
+            'offset': self.file.tell(),
+        }
+
+    def restore(self, state):
+        self.count = state['count']
+        self.unique = state.get('unique', self.count)
+        self.total_score = state['total_score']
+        self.heap = [(score, seq, Channel.from_dict(channel)) for score, seq, channel in state['top']]
+        heapq.heapify(self.heap)
+        if self.online is not None and state.get('online'):
+            self.online.restore(state['online'])
+
+        # Rows flushed after the checkpoint belong to pages that --resume crawls
+        # again, so they are cut off instead of being written a second time.
+        offset = state.get('offset')
+        if offset is not None and offset <= os.path.getsize(self.filename):
+            self.file.truncate(offset)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def columnar_schema(pa):
+    # Categories and the analysis text repeat across millions of rows, so they are
+    # stored once per batch as dictionaries; numbers keep their numeric types.
+    category = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('url', pa.string()),
+        ('text', pa.string()),
+        ('members', pa.int64()),
+        ('description', pa.string()),
+        ('category', category),
+        ('avg_post_reach', pa.int64()),
+        ('citations', pa.int64()),
+        ('engagement_rate', pa.float32()),
+        ('quality_score', pa.float32()),
+        ('reasons', pa.uint16()),
+        ('analysis', category),
+        ('source_category', category),
+        ('duplicate_of', pa.string()),
+    ])
+
+
+def columnar_format(path):
+    return 'parquet' if path.lower().endswith(('.parquet', '.pq')) else 'arrow'
+
+
+def free_path(path):
+    # Parquet and Arrow files can't be appended to, so a resumed run writes a sibling part.
+    stem, ext = os.path.splitext(path)
+    part = 1
+    while os.path.exists(path):
+        path = f"{stem}.{part}{ext}"
+        part += 1
+    return path
+
+
+class ColumnarWriter:
+    def __init__(self, path, batch_rows=65536, append=False):
+        self.pa = optional_import('pyarrow')
+        self.path = free_path(path) if append else path
+        self.format = columnar_format(path)
+        self.batch_rows = batch_rows
+        self.schema = columnar_schema(self.pa)
+        self.pending = []
+        self.count = 0
+
+        # Dictionaries only ever grow, so every batch after the first is a delta
+        # of the previous one instead of a replacement.
+        self.dictionaries = {
+            field.name: ({}, []) for field in self.schema if self.pa.types.is_dictionary(field.type)
+        }
+
+        if self.format == 'parquet':
+            import pyarrow.parquet
+
+            self.writer = pyarrow.parquet.ParquetWriter(self.path, self.schema)
+        else:
+            # Uncompressed IPC stream, so readers can map record batches without copying.
+            options = self.pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            self.writer = self.pa.ipc.new_stream(self.path, self.schema, options=options)
+
+    def add(self, channels):
+        self.pending.extend(channels)
+        while len(self.pending) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        pa = self.pa
+        rows = self.pending[:self.batch_rows]
+        del self.pending[:self.batch_rows]
+
+        columns = [
+            [channel.url for channel in rows],
+            [channel.text for channel in rows],
+            [channel.members for channel in rows],
+            [channel.description for channel in rows],
+            [channel.category for channel in rows],
+            [int(channel.avg_post_reach) for channel in rows],
+            [int(channel.citations) for channel in rows],
+            [channel.engagement_rate() for channel in rows],
+            [channel.score for channel in rows],
+            [channel.reasons for channel in rows],
+            ['; '.join(channel.analysis()) for channel in rows],
+            [channel.source_category for channel in rows],
+            [channel.duplicate_of for channel in rows],
+        ]
+        batch = pa.record_batch(
+            [self.column_array(field, values) for values, field in zip(columns, self.schema)],
+            schema=self.schema
+        )
+
+        # One call per batch: a Parquet row group or an Arrow record batch.
+        self.writer.write_batch(batch)
+        self.count += len(rows)
+
+    def column_array(self, field, values):
+        pa = self.pa
+        if field.name not in self.dictionaries:
+            return pa.array(values, type=field.type)
+
+        index, dictionary = self.dictionaries[field.name]
+        indices = []
+        for value in values:
+            code = index.get(value)
+            if code is None:
+                code = index[value] = len(dictionary)
+                dictionary.append(value)
+            indices.append(code)
+
+        return pa.DictionaryArray.from_arrays(
+            pa.array(indices, type=field.type.index_type), pa.array(dictionary, type=field.type.value_type)
+        )
+
+    def close(self):
+        if self.writer is None:
+            return
+
+        self.flush()
+        self.writer.close()
+        self.writer = None
+
+
+def read_columnar(path, columns=None):
+    """Open a Parquet or Arrow export memory-mapped and return it as a pyarrow Table."""
+    pa = optional_import('pyarrow')
+    if pa is None:
+        raise ImportError("Reading columnar exports requires pyarrow")
+
+    if columnar_format(path) == 'parquet':
+        import pyarrow.parquet
+
+        return pyarrow.parquet.read_table(path, columns=columns, memory_map=True)
+
+    table = pa.ipc.open_stream(pa.memory_map(path, 'r')).read_all()
+    return table.select(columns) if columns else table
+
+
+def iter_columnar(path, columns=None):
+    """Yield record batches from a Parquet or Arrow export without loading the whole file."""
+    pa = optional_import('pyarrow')
+    if pa is None:
+        raise ImportError("Reading columnar exports requires pyarrow")
+
+    if columnar_format(path) == 'parquet':
+        import pyarrow.parquet
+
+        yield from pyarrow.parquet.ParquetFile(path, memory_map=True).iter_batches(columns=columns)
+        return
+
+    for batch in pa.ipc.open_stream(pa.memory_map(path, 'r')):
+        yield batch.select(columns) if columns else batch
+
+
+QUERY_TOKEN = re.compile(r'\w+')
+QUERY_COLUMNS = ('members', 'reach', 'citations', 'score', 'engagement')
+QUERY_RANGES = ('members', 'reach', 'citations', 'score')
+
+
+def query_tokens(text):
+    return set(QUERY_TOKEN.findall(text.casefold()))
+
+
+class ChannelIndex:
+    """Indexes a channel snapshot for repeated filtered queries.
+
+    Title and description words map to ascending posting lists of row ids,
+    categories map to their rows, and members/reach/citations/score keep their
+    row ids sorted by value, so every filter knows its match count without a
+    scan. A query starts from the most selective filter and checks the others
+    against those candidate rows only.
+    """
+
+    def __init__(self, channels, missing=()):
+        from array import array
+
+        self.channels = list(channels)
+        # Query columns the source doesn't record; filtering on them is an error, not an empty result.
+        self.missing = frozenset(missing)
+        self.np = optional_import('numpy')
+
+        postings = collections.defaultdict(lambda: array('I'))
+        self.category_ids = {}
+        category_of = array('I')
+
+        for row, channel in enumerate(self.channels):
+            for token in query_tokens(f"{channel.text} {channel.description}"):
+                postings[token].append(row)
+            category = self.category_ids.setdefault(channel.category.casefold(), len(self.category_ids))
+            postings[('category', category)].append(row)
+            category_of.append(category)
+
+        # Unknown members sort below every range, which starts at 0.
+        columns = {
+            'members': [channel.members if channel.members is not None else -1 for channel in self.channels],
+            'reach': [channel.avg_post_reach for channel in self.channels],
+            'citations': [channel.citations for channel in self.channels],
+            'score': [channel.score or 0.0 for channel in self.channels],
+            'engagement': [channel.engagement_rate() for channel in self.channels],
+        }
+
+        np = self.np
+        if np is not None:
+            self.postings = {key: np.frombuffer(rows, dtype=np.uint32) for key, rows in postings.items()}
+            self.category_of = np.frombuffer(category_of, dtype=np.uint32)
+            self.columns = {name: np.asarray(values, dtype=np.float64) for name, values in columns.items()}
+            self.order = {name: np.argsort(self.columns[name], kind='stable') for name in QUERY_RANGES}
+            self.sorted = {name: self.columns[name][self.order[name]] for name in QUERY_RANGES}
+        else:
+            self.postings = dict(postings)
+            self.category_of = category_of
+            self.columns = columns
+            self.order = {
+                name: sorted(range(len(self.channels)), key=columns[name].__getitem__) for name in QUERY_RANGES
+            }
+            self.sorted = {name: [columns[name][row] for row in self.order[name]] for name in QUERY_RANGES}
+
+    def __len__(self):
+        return len(self.channels)
+
+    def range_bounds(self, name, low, high):
+        values = self.sorted[name]
+        low = 0 if low is None else low
+        if self.np is not None:
+            start = int(self.np.searchsorted(values, low, side='left'))
+            stop = len(values) if high is None else int(self.np.searchsorted(values, high, side='right'))
+        else:
+            import bisect
+
+            start = bisect.bisect_left(values, low)
+            stop = len(values) if high is None else bisect.bisect_right(values, high)
+        return start, stop
+
+    def match(self, text=None, category=None, ranges=None):
+        """Return the row ids of channels matching every filter.
+
+        `text` requires all of its words in the title or description; `ranges`
+        maps members/reach/citations/score to (low, high) bounds, either None.
+        """
+        for name in ranges or {}:
+            self.check_column(name)
+        filters = []
+
+        for token in sorted(query_tokens(text or '')):
+            rows = self.postings.get(token)
+            if rows is None:
+                return []
+            filters.append((len(rows), 'rows', rows))
+
+        if category:
+            category_id = self.category_ids.get(category.casefold())
+            if category_id is None:
+                return []
+            rows = self.postings[('category', category_id)]
+            filters.append((len(rows), 'category', category_id))
+
+        for name, (low, high) in (ranges or {}).items():
+            if name not in QUERY_RANGES:
+                raise ValueError(f"Unknown range: {name}")
+            start, stop = self.range_bounds(name, low, high)
+            if start >= stop:
+                return []
+            filters.append((stop - start, 'range', (name, low, high, start, stop)))
+
+        if not filters:
+            return range(len(self.channels))
+
+        filters.sort(key=lambda item: item[0])
+        _, kind, arg = filters[0]
+        if kind == 'rows':
+            rows = arg
+        elif kind == 'category':
+            rows = self.postings[('category', arg)]
+        else:
+            name, _, _, start, stop = arg
+            rows = self.order[name][start:stop]
+
+        if self.np is not None:
+            return self.check_numpy(rows, filters[1:])
+        return self.check_python(rows, filters[1:])
+
+    def check_numpy(self, rows, filters):
+        np = self.np
+        rows = np.asarray(rows)
+        for _, kind, arg in filters:
+            if not len(rows):
+                break
+            if kind == 'rows':
+                found = arg[np.minimum(np.searchsorted(arg, rows), len(arg) - 1)] == rows
+            elif kind == 'category':
+                found = self.category_of[rows] == arg
+            else:
+                name, low, high = arg[:3]
+                values = self.columns[name][rows]
+                found = values >= (0 if low is None else low)
+                if high is not None:
+                    found &= values <= high
+            rows = rows[found]
+        return rows
+
+    def check_python(self, rows, filters):
+        import bisect
+
+        def has_row(posting, row):
+            i = bisect.bisect_left(posting, row)
+            return i < len(posting) and posting[i] == row
+
+        for _, kind, arg in filters:
+            if kind == 'rows':
+                rows = [row for row in rows if has_row(arg, row)]
+            elif kind == 'category':
+                rows = [row for row in rows if self.category_of[row] == arg]
+            else:
+                name, low, high = arg[:3]
+                values = self.columns[name]
+                low = 0 if low is None else low
+                rows = [row for row in rows if low <= values[row] and (high is None or values[row] <= high)]
+        return rows
+
+    def check_column(self, name):
+        if name in self.missing:
+            raise ValueError(f"This source has no {name} data; re-run the crawl or query its .parquet/.sqlite output")
+
+    def top(self, rows, sort='score', limit=20):
+        if sort not in QUERY_COLUMNS:
+            raise ValueError(f"Unknown sort column: {sort}")
+        self.check_column(sort)
+
+        values = self.columns[sort]
+        if self.np is not None:
+            np = self.np
+            rows = np.asarray(rows, dtype=np.int64)
+            keys = -values[rows]
+            if limit is not None and len(rows) > limit:
+                part = np.argpartition(keys, limit - 1)[:limit]
+                rows, keys = rows[part], keys[part]
+            best = rows[np.argsort(keys, kind='stable')]
+        elif limit is None:
+            best = sorted(rows, key=values.__getitem__, reverse=True)
+        else:
+            best = heapq.nlargest(limit, rows, key=values.__getitem__)
+        return [self.channels[row] for row in best]
+
+    def query(self, text=None, category=None, ranges=None, sort='score', limit=20):
+        """Return up to `limit` matching channels, highest `sort` value first."""
+        return self.top(self.match(text, category, ranges), sort, limit)
+
+    def save(self, path, source):
+        """Write the index to the `path` directory as .npy arrays, tagged with the source's (mtime, size)."""
+        import shutil
+
+        np = self.np
+        tmp_path = path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        lists = list(self.postings.values())
+        keys = np.fromiter((index_key(key) for key in self.postings), dtype=np.uint64, count=len(lists))
+        by_key = np.argsort(keys, kind='stable')
+        starts = np.zeros(len(lists) + 1, dtype=np.int64)
+        np.cumsum([len(lists[i]) for i in by_key], out=starts[1:])
+        arrays = {
+            'keys': keys[by_key],
+            'starts': starts,
+            'rows': np.concatenate([lists[i] for i in by_key]) if lists else np.zeros(0, dtype=np.uint32),
+            'category_of': self.category_of,
+        }
+        for name in QUERY_COLUMNS:
+            arrays[f'column_{name}'] = self.columns[name]
+        for name in QUERY_RANGES:
+            arrays[f'order_{name}'] = self.order[name]
+            arrays[f'sorted_{name}'] = self.sorted[name]
+
+        channel_starts = [0]
+        with open(os.path.join(tmp_path, 'channels.jsonl'), 'wb') as f:
+            for channel in self.channels:
+                line = json.dumps(channel.to_dict(), ensure_ascii=False).encode('utf-8') + b'\n'
+                f.write(line)
+                channel_starts.append(channel_starts[-1] + len(line))
+        arrays['channel_starts'] = np.asarray(channel_starts, dtype=np.int64)
+
+        for name, values in arrays.items():
+            np.save(os.path.join(tmp_path, f'{name}.npy'), values)
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'source': list(source), 'missing': sorted(self.missing),
+                       'categories': self.category_ids}, f, ensure_ascii=False)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, source):
+        """Memory-map an index saved by save(), or return None if it is missing or out of date."""
+        np = optional_import('numpy')
+        if np is None:
+            return None
+
+        try:
+            with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('version') != INDEX_VERSION or meta.get('source') != list(source):
+                return None
+
+            def array(name):
+                return np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+
+            index = cls.__new__(cls)
+            index.np = np
+            index.missing = frozenset(meta['missing'])
+            index.category_ids = meta['categories']
+            index.postings = StoredPostings(np, array('keys'), array('starts'), array('rows'))
+            index.category_of = array('category_of')
+            index.columns = {name: array(f'column_{name}') for name in QUERY_COLUMNS}
+            index.order = {name: array(f'order_{name}') for name in QUERY_RANGES}
+            index.sorted = {name: array(f'sorted_{name}') for name in QUERY_RANGES}
+            index.channels = StoredChannels(os.path.join(path, 'channels.jsonl'), array('channel_starts'))
+        except (OSError, ValueError, KeyError):
+            return None
+        return index
+
+
+INDEX_VERSION = 1
+
+
+def index_key(key):
+    # Words and ('category', id) keys as 64-bit hashes, so a saved vocabulary is a
+    # sorted array searched through its memory map instead of a dict to load.
+    if isinstance(key, tuple):
+        key = '\0'.join(map(str, key))
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class StoredPostings:
+    def __init__(self, np, keys, starts, rows):
+        self.np = np
+        self.keys = keys
+        self.starts = starts
+        self.rows = rows
+
+    def get(self, key, default=None):
+        key = self.np.uint64(index_key(key))
+        i = int(self.np.searchsorted(self.keys, key))
+        if i == len(self.keys) or self.keys[i] != key:
+            return default
+        return self.rows[self.starts[i]:self.starts[i + 1]]
+
+    def __getitem__(self, key):
+        rows = self.get(key)
+        if rows is None:
+            raise KeyError(key)
+        return rows
+
+
+class StoredChannels:
+    # Channel records of a saved index, only decoded for the rows a query returns.
+    def __init__(self, path, starts):
+        import mmap
+
+        self.starts = starts
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if len(starts) > 1 else b''
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def __getitem__(self, row):
+        row = int(row)
+        return Channel.from_dict(json.loads(self.data[self.starts[row]:self.starts[row + 1]]))
+
+
+def load_channels(path):
+    """Read the channels of a finished crawl from its CSV, columnar export or history database."""
+    lower = path.lower()
+
+    if lower.endswith(('.parquet', '.pq', '.arrow')):
+        table = read_columnar(path, ['url', 'text', 'members', 'description', 'category', 'avg_post_reach',
+                                     'citations', 'quality_score', 'source_category'])
+        columns = [table.column(name).to_pylist() for name in table.column_names]
+        return [
+            Channel(url, text, members=members, description=description, category=category, avg_post_reach=reach,
+                    citations=citations, source_category=source_category, score=score)
+            for url, text, members, description, category, reach, citations, score, source_category in zip(*columns)
+        ]
+
+    if lower.endswith(('.sqlite', '.db')):
+        history = HistoryStore(path)
+        try:
+            return [
+                Channel(url, title, members=members, category=category, avg_post_reach=reach, citations=citations,
+                        source_category=source_category, score=score)
+                for url, title, members, reach, citations, score, category, source_category in history.latest()
+            ]
+        finally:
+            history.close()
+
+    channels = []
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            channels.append(Channel(
+                row['url'], row['text'],
+                members=int(float(row['members'])) if row.get('members') else None,
+                description=row.get('description', ''),
+                category=row.get('category', ''),
+                avg_post_reach=int(float(row['avg_post_reach'])) if row.get('avg_post_reach') else 0,
+                citations=int(float(row['citations'])) if row.get('citations') else 0,
+                source_category=row.get('source_category', ''),
+                score=float(row['quality_score']) if row.get('quality_score') else None,
+            ))
+    return channels
+
+
+def missing_columns(path):
+    # CSVs written before reach and citations were exported load them as 0.
+    if path.lower().endswith(('.parquet', '.pq', '.arrow', '.sqlite', '.db')):
+        return set()
+
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        header = next(csv.reader(f), [])
+    missing = set()
+    if 'avg_post_reach' not in header:
+        missing.update(('reach', 'engagement'))
+    if 'citations' not in header:
+        missing.add('citations')
+    return missing
+
+
+def index_path(path):
+    return path + '.index'
+
+
+@functools.lru_cache(maxsize=4)
+def cached_index(path, mtime, size):
+    # Keyed on mtime and size, so a file rewritten by a later crawl is indexed
+    # afresh; the saved index next to it is checked against the same pair.
+    index = ChannelIndex.load(index_path(path), (mtime, size))
+    if index is not None:
+        return index
+
+    index = ChannelIndex(load_channels(path), missing_columns(path))
+    if index.np is not None:
+        try:
+            index.save(index_path(path), (mtime, size))
+        except OSError:
+            pass  # A read-only results directory just means indexing again next time.
+    return index
+
+
+def channel_index(source):
+    if isinstance(source, ChannelIndex):
+        return source
+    if isinstance(source, str):
+        stat = os.stat(source)
+        return cached_index(os.path.abspath(source), stat.st_mtime, stat.st_size)
+    return ChannelIndex(source)
+
+
+class ResponseCache:
+    def __init__(self, path, max_bytes=200 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                status INTEGER,
+                headers TEXT,
+                body BLOB,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL,
+                accessed_at REAL,
+                size INTEGER
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.db.commit()
+
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, url):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT status, headers, body, etag, last_modified, stored_at FROM responses WHERE url = ?",
+                (url,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            self.db.execute("UPDATE responses SET accessed_at = ? WHERE url = ?", (time.time(), url))
+            self.db.commit()
+
+        status, headers, body, etag, last_modified, stored_at = row
+        return {
+            'url': url,
+            'status': status,
+            'headers': json.loads(headers),
+            'body': body,
+            'etag': etag,
+            'last_modified': last_modified,
+            'stored_at': stored_at
+        }
+
+    def put(self, url, response):
+        # The body is stored already decoded, so transfer headers no longer apply.
+        headers = {key: value for key, value in response.headers.items()
+                   if key.lower() not in ('content-encoding', 'content-length', 'transfer-encoding')}
+        body = response.content
+        now = time.time()
+
+        with self.lock:
+            previous = self.db.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            if previous:
+                self.total_bytes -= previous[0]
+
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, response.status_code, json.dumps(headers), body,
+                 response.headers.get('ETag'), response.headers.get('Last-Modified'), now, now, len(body))
+            )
+            self.total_bytes += len(body)
+            self.evict()
+            self.db.commit()
+
+    def refresh(self, url):
+        with self.lock:
+            now = time.time()
+            self.db.execute("UPDATE responses SET stored_at = ?, accessed_at = ? WHERE url = ?", (now, now, url))
+            self.db.commit()
+
+    def evict(self):
+        while self.total_bytes > self.max_bytes:
+            oldest = self.db.execute(
+                "SELECT url, size FROM responses ORDER BY accessed_at LIMIT 64"
+            ).fetchall()
+            if not oldest:
+                self.total_bytes = 0
+                break
+
+            for url, size in oldest:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                self.db.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self.total_bytes -= size
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class HistoryStore:
+    # One row per channel per run. The (username, run_at) key serves both the
+    # upsert and the "previous snapshot of this channel" lookups.
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                username TEXT NOT NULL,
+                run_at REAL NOT NULL,
+                url TEXT,
+                title TEXT,
+                members INTEGER,
+                avg_post_reach INTEGER,
+                citations INTEGER,
+                score REAL,
+                category TEXT,
+                source_category TEXT,
+                PRIMARY KEY (username, run_at)
+            ) WITHOUT ROWID
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS snapshots_run_at ON snapshots (run_at)")
+        self.db.commit()
+
+    def record(self, run_at, channels):
+        rows = [
+            (channel.username(), run_at, channel.url, channel.text, channel.members, channel.avg_post_reach,
+             channel.citations, channel.score, channel.category, channel.source_category)
+            for channel in channels
+        ]
+
+        with self.lock:
+            self.db.executemany("""
+                INSERT INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (username, run_at) DO UPDATE SET
+                    url = excluded.url, title = excluded.title, members = excluded.members,
+                    avg_post_reach = excluded.avg_post_reach, citations = excluded.citations,
+                    score = excluded.score, category = excluded.category,
+                    source_category = excluded.source_category
+            """, rows)
+            self.db.commit()
+
+    def has_earlier_run(self, run_at):
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM snapshots WHERE run_at < ? LIMIT 1", (run_at,)).fetchone() is not None
+
+    def previous(self, run_at, usernames):
+        found = {}
+        with self.lock:
+            for username in usernames:
+                row = self.db.execute("""
+                    SELECT members, avg_post_reach, citations, score FROM snapshots
+                    WHERE username = ? AND run_at < ? ORDER BY run_at DESC LIMIT 1
+                """, (username, run_at)).fetchone()
+                if row is not None:
+                    found[username] = row
+        return found
+
+    def changes(self, run_at):
+        # Each current row finds its predecessor through the primary key, so this is
+        # one pass over the run plus an index probe per channel.
+        with self.lock:
+            cursor = self.db.execute("""
+                SELECT cur.username, cur.url, cur.title, cur.members, prev.members,
+                       cur.avg_post_reach, prev.avg_post_reach, cur.citations, prev.citations,
+                       cur.score, prev.score, prev.run_at
+                FROM snapshots AS cur
+                LEFT JOIN snapshots AS prev ON prev.username = cur.username AND prev.run_at = (
+                    SELECT MAX(run_at) FROM snapshots WHERE username = cur.username AND run_at < cur.run_at
+                )
+                WHERE cur.run_at = ?
+            """, (run_at,))
+            yield from cursor
+
+    def latest(self):
+        with self.lock:
+            return self.db.execute("""
+                SELECT url, title, members, avg_post_reach, citations, score, category, source_category
+                FROM snapshots WHERE run_at = (SELECT MAX(run_at) FROM snapshots)
+            """).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class ChannelMetricsCache:
+    def __init__(self, path, ttl):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS channel_metrics (
+                username TEXT PRIMARY KEY,
+                members INTEGER,
+                avg_post_reach INTEGER,
+                citations INTEGER,
+                fetched_at REAL
+            ) WITHOUT ROWID
+        """)
+        self.db.commit()
+
+    def get_many(self, usernames, offline=False):
+        found = {}
+        oldest = 0 if offline else time.time() - self.ttl
+        usernames = list(usernames)
+
+        with self.lock:
+            for i in range(0, len(usernames), 500):
+                chunk = usernames[i:i + 500]
+                rows = self.db.execute(
+                    f"SELECT username, members, avg_post_reach, citations FROM channel_metrics "
+                    f"WHERE fetched_at >= ? AND username IN ({', '.join('?' * len(chunk))})",
+                    [oldest] + chunk
+                )
+                for username, members, avg_post_reach, citations in rows:
+                    found[username] = {'members': members, 'avg_post_reach': avg_post_reach, 'citations': citations}
+        return found
+
+    def put_many(self, metrics):
+        now = time.time()
+        rows = [(username, stats.get('members'), stats.get('avg_post_reach'), stats.get('citations'), now)
+                for username, stats in metrics.items()]
+
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO channel_metrics VALUES (?, ?, ?, ?, ?)", rows)
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def channel_delta(channel, previous):
+    if previous is None:
+        return None
+
+    members, avg_post_reach, citations, score = previous
+    return {
+        'members': (channel.members or 0) - (members or 0),
+        'avg_post_reach': channel.avg_post_reach - (avg_post_reach or 0),
+        'citations': channel.citations - (citations or 0),
+        'score': (channel.score or 0) - (score or 0),
+        'members_before': members or 0,
+    }
+
+
+def delta_text(delta):
+    if delta is None:
+        return "new channel"
+
+    parts = [
+        f"{delta[field]:+,.0f} {label}"
+        for field, label in (('members', 'subscribers'), ('avg_post_reach', 'reach'), ('citations', 'citations'))
+        if delta[field]
+    ]
+    if delta['score']:
+        parts.append(f"score {delta['score']:+.0f}")
+    return ', '.join(parts) or "no change"
+
+
+def cached_response(entry):
+    import requests
+
+    response = requests.Response()
+    response.status_code = entry['status']
+    response.url = entry['url']
+    response.headers = requests.structures.CaseInsensitiveDict(entry['headers'])
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response._content = entry['body']
+    response.from_cache = True
+    return response
+
+
+def offline_miss(url):
+    # Same answer an HTTP cache gives to "only-if-cached" when it has nothing stored.
+    import requests
+
+    response = requests.Response()
+    response.status_code = 504
+    response.url = url
+    response.reason = "Not in cache (offline mode)"
+    response._content = b''
+    response.from_cache = True
+    response.offline_miss = True
+    return response
+
+
+REQUEST_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+PARSE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+STAGES = ('fetch', 'parse', 'extract', 'enrich', 'score', 'write')
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': {('+Inf' if bound == float('inf') else str(bound)): total for bound, total in self.cumulative()},
+        }
+
+
+class RunMetrics:
+    # Stage times are summed over workers, so with concurrency they can exceed
+    # the wall-clock run time.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+
+        self.request_seconds = {}
+        self.parse_seconds = Histogram(PARSE_BUCKETS)
+        self.requests = {}
+        self.bytes_downloaded = 0
+        self.retries = 0
+        self.pages = {}
+        self.channels = 0
+        self.stage_seconds = dict.fromkeys(STAGES, 0.0)
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def observe_request(self, endpoint, seconds, response):
+        if response is None:
+            outcome = 'error'
+        elif getattr(response, 'revalidated', False):
+            outcome = 'not_modified'
+        elif getattr(response, 'from_cache', False):
+            outcome = 'cache'
+        elif response.status_code < 400:
+            outcome = 'ok'
+        else:
+            outcome = 'http_error'
+
+        with self.lock:
+            key = (endpoint, outcome)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if outcome == 'cache':
+                return
+
+            if endpoint not in self.request_seconds:
+                self.request_seconds[endpoint] = Histogram(REQUEST_BUCKETS)
+            self.request_seconds[endpoint].observe(seconds)
+            self.stage_seconds['fetch'] += seconds
+            if response is not None and outcome != 'not_modified':
+                self.bytes_downloaded += len(response.content) if getattr(response, 'body_bytes', None) is None else response.body_bytes
+
+    def observe_parse(self, seconds):
+        with self.lock:
+            self.parse_seconds.observe(seconds)
+            self.stage_seconds['parse'] += seconds
+
+    def add_page(self, mode, channels):
+        with self.lock:
+            self.pages[mode] = self.pages.get(mode, 0) + 1
+            self.channels += channels
+
+    def add_retry(self):
+        with self.lock:
+            self.retries += 1
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.stage_seconds[stage] += time.perf_counter() - start
+
+    def request_count(self, outcomes=None):
+        return sum(count for (_, outcome), count in self.requests.items() if outcomes is None or outcome in outcomes)
+
+    def report(self):
+        elapsed = self.elapsed()
+        with self.lock:
+            return {
+                'started_at': self.started_at,
+                'elapsed_seconds': elapsed,
+                'pages': dict(self.pages),
+                'channels': self.channels,
+                'channels_per_second': self.channels / elapsed if elapsed else 0,
+                'bytes_downloaded': self.bytes_downloaded,
+                'retries': self.retries,
+                'requests': [
+                    {'endpoint': endpoint, 'outcome': outcome, 'count': count}
+                    for (endpoint, outcome), count in sorted(self.requests.items())
+                ],
+                'request_seconds': {endpoint: hist.to_dict() for endpoint, hist in self.request_seconds.items()},
+                'parse_seconds': self.parse_seconds.to_dict(),
+                'stage_seconds': dict(self.stage_seconds),
+            }
+
+    def prometheus(self):
+        report = self.report()
+        lines = []
+
+        def sample(name, labels, value):
+            label_text = ','.join(f'{key}="{val}"' for key, val in labels)
+            lines.append(f"tgstat_{name}{{{label_text}}} {value}" if label_text else f"tgstat_{name} {value}")
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP tgstat_{name} {help_text}")
+            lines.append(f"# TYPE tgstat_{name} {kind}")
+            for labels, value in samples:
+                sample(name, labels, value)
+
+        def histogram(name, help_text, series):
+            lines.append(f"# HELP tgstat_{name} {help_text}")
+            lines.append(f"# TYPE tgstat_{name} histogram")
+            for labels, hist in series:
+                for bound, total in hist['buckets'].items():
+                    sample(f"{name}_bucket", labels + [('le', bound)], total)
+                sample(f"{name}_sum", labels, hist['sum'])
+                sample(f"{name}_count", labels, hist['count'])
+
+        histogram('request_duration_seconds', "HTTP request latency.",
+                  [([('endpoint', endpoint)], hist) for endpoint, hist in sorted(report['request_seconds'].items())])
+        histogram('page_parse_seconds', "Time to extract channels from one HTML page.", [([], report['parse_seconds'])])
+
+        metric('requests_total', 'counter', "Requests by endpoint and outcome.",
+               [([('endpoint', item['endpoint']), ('outcome', item['outcome'])], item['count'])
+                for item in report['requests']])
+        metric('downloaded_bytes_total', 'counter', "Response body bytes downloaded.",
+               [([], report['bytes_downloaded'])])
+        metric('retries_total', 'counter', "Requests retried.", [([], report['retries'])])
+        metric('pages_total', 'counter', "Pages processed by mode.",
+               [([('mode', mode)], count) for mode, count in sorted(report['pages'].items())])
+        metric('channels_total', 'counter', "New channels collected.", [([], report['channels'])])
+        metric('stage_seconds_total', 'counter', "Time spent per stage, summed over workers.",
+               [([('stage', stage)], seconds) for stage, seconds in report['stage_seconds'].items()])
+        metric('run_duration_seconds', 'gauge', "Wall-clock run time.", [([], report['elapsed_seconds'])])
+        metric('run_start_timestamp_seconds', 'gauge', "Unix time the run started.", [([], report['started_at'])])
+
+        return '\n'.join(lines) + '\n'
+
+
+def write_atomic(path, text):
+    # node_exporter may read the textfile at any moment, so it's never left half-written.
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def timed_parse_page(content, base_url):
+    start = time.perf_counter()
+    links, card_count = parse_page(content, base_url)
+    return links, card_count, time.perf_counter() - start
+
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+class TelegramNotifier:
+    # Messages are queued and sent from one background thread, so reporting
+    # never waits on the Bot API; whatever piles up meanwhile goes out as digests.
+    def __init__(self, parser, token, chat_id, api_base="https://api.telegram.org",
+                 timeout=(5, 15), max_attempts=5, linger=0.5):
+        self.parser = parser
+        self.url = f"{api_base.rstrip('/')}/bot{token}/sendMessage"
+        self.chat_id = chat_id
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.linger = linger
+
+        self.queue = queue.Queue()
+        self.thread = None
+        self.http_session = None
+        self.sent = 0
+        self.messages = 0
+        self.failed = 0
+
+    def notify(self, message):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.worker, name="telegram-notifier", daemon=True)
+            self.thread.start()
+        self.queue.put(message)
+
+    def close(self, timeout=60):
+        if self.thread is None:
+            return True
+
+        self.queue.put(None)
+        self.thread.join(timeout)
+        done = not self.thread.is_alive()
+        self.thread = None
+        if self.http_session is not None:
+            self.http_session.close()
+            self.http_session = None
+        return done
+
+    def worker(self):
+        stopping = False
+        while not stopping:
+            pending = [self.queue.get()]
+            deadline = time.monotonic() + self.linger
+            while pending[-1] is not None:
+                try:
+                    pending.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            if pending[-1] is None:
+                stopping = True
+                pending.pop()
+
+            for digest, count in digests(pending):
+                if self.send(digest):
+                    self.sent += count
+                    self.messages += 1
+                else:
+                    self.failed += count
+
+    def session(self):
+        if self.http_session is None:
+            import requests
+
+            self.http_session = requests.Session()
+            self.http_session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            self.http_session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        return self.http_session
+
+    def send(self, text):
+        payload = {
+            "chat_id": self.chat_id,
+            "text": text,
+            "parse_mode": "HTML"
+        }
+
+        for attempt in range(self.max_attempts):
+            delay = 2 ** attempt
+            try:
+                response = self.session().post(self.url, data=payload, timeout=self.timeout)
+                if response.status_code == 200:
+                    return True
+
+                if response.status_code == 429:
+                    try:
+                        delay = response.json()['parameters']['retry_after']
+                    except (ValueError, KeyError, TypeError):
+                        delay = int(response.headers.get('Retry-After', delay))
+                    self.parser.print_status(f"Telegram rate limit hit, retrying in {delay}s", "warning")
+                elif response.status_code < 500:
+                    self.parser.print_status(f"Telegram rejected message: {response.status_code} {response.text[:200]}", "error")
+                    return False
+            except Exception as e:
+                self.parser.print_status(f"Failed to send Telegram message: {str(e)}", "error")
+
+            if attempt + 1 < self.max_attempts:
+                time.sleep(delay)
+
+        return False
+
+
+def clip_html_text(text, limit):
+    escaped = html.escape(text, quote=False)
+    if len(escaped) <= limit:
+        return escaped
+
+    # Escaped one character at a time, so the cut never lands inside an entity.
+    pieces, size = [], len("…")
+    for char in text:
+        piece = html.escape(char, quote=False)
+        if size + len(piece) > limit:
+            break
+        pieces.append(piece)
+        size += len(piece)
+    return "".join(pieces) + "…"
+
+
+def digests(messages, limit=TELEGRAM_MESSAGE_LIMIT):
+    # Whole notifications are never split, so the HTML markup of each stays
+    # balanced; notify_channel already keeps every one within the limit.
+    separator = "\n\n" + "—" * 10 + "\n\n"
+    current, count = "", 0
+    for message in messages:
+        if current and len(current) + len(separator) + len(message) > limit:
+            yield current, count
+            current, count = "", 0
+        current = f"{current}{separator}{message}" if current else message
+        count += 1
+
+    if current:
+        yield current, count
 
 
 class TGStatCmdParser:
     def __init__(self):
         self.links = []
+        self.ranked = []
 
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-            'Referer': 'https://tgstat.ru/',
-        })
+        self.sessions = None
+        self.session_lock = threading.Lock()
+        self.session_configs = None
+        self.proxies = []
+        self.session_rate = 0
+        self.api_rate = 0
+        self.html_rate = 0
 
         self.stop_parsing = False
+        self.quiet = False
 
         self.ai_threshold = 20
 
+        self.concurrency = 4
+        self.pool_size = None
+        self.connect_timeout = 5
+        self.read_timeout = 30
+        self.max_retries = 5
+        self.backoff_base = 0.5
+        self.backoff_cap = 60
+        self.retry_after_cap = 600
+        self.breaker_threshold = 5
+        self.breaker_cooldown = 30
+        self.breaker = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+        self.max_body_bytes = 10 * 1024 * 1024
+        self.incremental = False
+        self.parse_workers = min(4, os.cpu_count() or 1)
+        self.global_rate = 10
+        self.host_rate = 4
+
+        self.api_base = "https://tgstat.ru"
+
+        self.cache = None
+        self.cache_path = "tgstat_cache.sqlite"
+        self.cache_max_bytes = 200 * 1024 * 1024
+        self.cache_ttls = {
+            'api': 6 * 3600,
+            'html': 6 * 3600,
+        }
+        self.offline = False
+
+        self.enrich_top = 50
+        self.enrich_budget = 50
+        self.enrich_ttl = 24 * 3600
+        self.enrich_spent = 0
+
+        self.dedup = 'flag'
+        self.dedup_threshold = 0.8
+        self.dedup_max = None
+        self.duplicates = None
+        self.mirror_count = 0
+
+        self.checkpoint_path = "tgstat_checkpoint.json"
+        self.checkpoint_every = 5
+        self.urls = []
+        self.max_pages = 50
+        self.progress = {}
+        self.seen_channels = set()
+        self.page_fingerprints = {}
+        self.pages_since_checkpoint = 0
+
+        self.output_path = "tgstat_links.csv"
+        self.streaming = False
+        self.stream = None
+        self.online = False
+        self.notify_warmup = 200
+        self.notify_margin = 5
+        self.notify_quantile = None
+        self.notified_channels = set()
+        self.stream_state = None
+        self.columnar_path = None
+        self.columnar = None
+
+        self.history_path = "tgstat_history.sqlite"
+        self.history = None
+        self.metrics_cache = None
+        self.run_at = None
+        self.growth_threshold = 5
+
         self.telegram_enabled = False
         self.telegram_token = ""
         self.telegram_chat_id = ""
+        self.telegram_api = "https://api.telegram.org"
+        self.notifier = None
+
+        self.metrics = RunMetrics()
+        self.metrics_json_path = None
+        self.metrics_prom_path = None
+        self.progress_interval = 0.5 if sys.stdout.isatty() else 10
+        self.last_progress = 0
+        self.progress_width = 0
+
+    @property
+    def session_pool(self):
+        if self.sessions is None:
+            with self.session_lock:
+                if self.sessions is None:
+                    configs = self.session_configs or [{'proxy': proxy} for proxy in self.proxies] or [{}]
+                    self.sessions = SessionPool([
+                        PooledSession(
+                            config.get('name') or f"#{i + 1}",
+                            self.make_session(config),
+                            config.get('rate', self.session_rate),
+                            {
+                                'api': config.get('api_rate', self.api_rate),
+                                'html': config.get('html_rate', self.html_rate),
+                            },
+                        )
+                        for i, config in enumerate(configs)
+                    ])
+
+        return self.sessions
+
+    def make_session(self, config):
+        import requests
+
+        pool_size = self.pool_size or max(10, self.concurrency)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
+            'Referer': 'https://tgstat.ru/',
+            'Accept-Encoding': 'gzip, deflate, br' if optional_import('brotli') else 'gzip, deflate',
+            'Connection': 'keep-alive',
+        })
+        session.headers.update(config.get('headers') or {})
+        session.cookies.update(config.get('cookies') or {})
+        if config.get('proxy'):
+            session.proxies = {'http': config['proxy'], 'https': config['proxy']}
+        return session
 
     def print_header(self):
+        if self.quiet:
+            return
+
         print(f"{Fore.CYAN}{'=' * 60}")
         print(f"{Fore.WHITE}{Style.BRIGHT}          TGSTAT Parser - rxinallday")
         print(f"{Fore.CYAN}{'=' * 60}{Style.RESET_ALL}")
 
     def print_status(self, message, status_type="info"):
+        if self.quiet and status_type != "error":
+            return
+
+        self.clear_progress()
+
         prefix = ""
         if status_type == "info":
             prefix = f"{Fore.BLUE}[INFO]{Style.RESET_ALL} "
@@ -52,7 +2934,54 @@ class TGStatCmdParser:
         elif status_type == "progress":
             prefix = f"{Fore.CYAN}[PROGRESS]{Style.RESET_ALL} "
 
-        print(f"{prefix}{message}")
+        print(f"{prefix}{message}")
+
+    def show_progress(self, force=False):
+        now = time.monotonic()
+        if self.quiet or (not force and now - self.last_progress < self.progress_interval):
+            return
+        self.last_progress = now
+
+        metrics = self.metrics
+        elapsed = metrics.elapsed()
+        failed = metrics.request_count(('error', 'http_error'))
+        line = (
+            f"{Fore.CYAN}[PROGRESS]{Style.RESET_ALL} {sum(metrics.pages.values())} pages | "
+            f"{len(self.seen_channels)} channels | {metrics.bytes_downloaded / (1024 * 1024):.1f} MB | "
+            f"{metrics.request_count()} requests, {failed} failed | "
+            f"{metrics.channels / elapsed if elapsed else 0:.0f} channels/s"
+        )
+
+        if sys.stdout.isatty():
+            padding = max(0, self.progress_width - len(line))
+            print(f"\r{line}{' ' * padding}", end='', flush=True)
+            self.progress_width = len(line)
+        else:
+            print(line)
+
+    def clear_progress(self):
+        if self.progress_width:
+            print(f"\r{' ' * self.progress_width}\r", end='')
+            self.progress_width = 0
+
+    def report_metrics(self):
+        report = self.metrics.report()
+        stages = ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in report['stage_seconds'].items())
+        self.print_status(
+            f"Run took {report['elapsed_seconds']:.1f}s ({report['channels_per_second']:.0f} channels/s, "
+            f"{report['bytes_downloaded'] / (1024 * 1024):.1f} MB downloaded); {stages}",
+            "info"
+        )
+
+        try:
+            if self.metrics_json_path:
+                write_atomic(self.metrics_json_path, json.dumps(report, indent=2))
+                self.print_status(f"Run report saved to {os.path.abspath(self.metrics_json_path)}", "success")
+            if self.metrics_prom_path:
+                write_atomic(self.metrics_prom_path, self.metrics.prometheus())
+                self.print_status(f"Prometheus metrics saved to {os.path.abspath(self.metrics_prom_path)}", "success")
+        except Exception as e:
+            self.print_status(f"Failed to save run metrics: {e}", "error")
 
     def configure_telegram(self):
         print(f"\n{Fore.CYAN}{'=' * 60}")
@@ -73,132 +3002,557 @@ class TGStatCmdParser:
         if not self.telegram_enabled:
             return False
 
-        try:
-            url = f"https://api.telegram.org/bot{self.telegram_token}/sendMessage"
-            payload = {
-                "chat_id": self.telegram_chat_id,
-                "text": message,
-                "parse_mode": "HTML"
-            }
-            response = requests.post(url, data=payload)
-            return response.status_code == 200
-        except Exception as e:
-            self.print_status(f"Failed to send Telegram message: {str(e)}", "error")
-            return False
+        if self.notifier is None:
+            self.notifier = TelegramNotifier(self, self.telegram_token, self.telegram_chat_id, self.telegram_api)
+        self.notifier.notify(message)
+        return True
+
+    def flush_notifications(self):
+        if self.notifier is None:
+            return
+
+        notifier = self.notifier
+        self.notifier = None
+        if not notifier.close():
+            self.print_status("Gave up waiting for queued Telegram notifications", "warning")
 
-    def start_parsing(self):
+        if notifier.sent:
+            self.print_status(f"Sent {notifier.sent} Telegram notifications in {notifier.messages} messages", "success")
+        if notifier.failed:
+            self.print_status(f"Failed to deliver {notifier.failed} Telegram notifications", "error")
+
+    def start_parsing(self, resume=False):
         self.print_header()
 
-        url = input("Enter URL: ").strip()
-        if not url:
-            self.print_status("No URL provided. Exiting.", "error")
-            return
+        if resume:
+            if not self.load_checkpoint():
+                return
+        else:
+            urls = read_urls(input("Enter URL (several separated by commas, or a path to a file with URLs): ").strip())
+            if not urls:
+                self.print_status("No URL provided. Exiting.", "error")
+                return
+
+            try:
+                max_pages = int(input("Enter maximum number of pages to parse: ") or "50")
+            except ValueError:
+                max_pages = 50
+                self.print_status("Invalid input, using default value: 50 pages", "warning")
+
+            self.new_run(urls, max_pages)
+
+            self.streaming = input("Stream scored results to CSV while crawling? (y/n) [n]: ").lower().strip() == 'y'
 
         try:
-            max_pages = int(input("Enter maximum number of pages to parse: ") or "50")
+            self.concurrency = max(1, int(input("Enter number of concurrent page requests: ") or "4"))
         except ValueError:
-            max_pages = 50
-            self.print_status("Invalid input, using default value: 50 pages", "warning")
+            self.concurrency = 4
+            self.print_status("Invalid input, using default value: 4 concurrent requests", "warning")
+
+        self.configure_cache()
+        self.configure_telegram()
 
+        self.run(resume)
+
+    def new_run(self, urls, max_pages):
+        self.urls = urls
+        self.max_pages = max_pages
         self.links = []
+        self.progress = {}
+        self.seen_channels = set()
+        self.page_fingerprints = {}
+        self.stream_state = None
+        self.notified_channels = set()
+        self.run_at = time.time()
+
+    def run(self, resume=False):
+        urls = self.urls
+        max_pages = self.max_pages
         self.stop_parsing = False
+        self.metrics = RunMetrics()
+        self.breaker = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+        self.enrich_spent = 0
+        self.streaming = self.streaming or self.online
+        self.duplicates = NearDuplicates(self.dedup_threshold, self.dedup_limit()) if self.dedup != 'off' else None
+        self.mirror_count = 0
+        if self.run_at is None:
+            self.run_at = time.time()
+        if self.history_path:
+            self.history = self.open_history()
+        if self.cache is not None and self.enrich_top > 0:
+            self.metrics_cache = self.open_metrics_cache()
 
-        self.configure_telegram()
+        if self.streaming:
+            self.stream = ResultStream(self, self.output_path, append=resume)
+            if self.stream_state:
+                self.stream.restore(self.stream_state)
+            if self.columnar_path:
+                self.columnar = self.open_columnar(append=resume)
 
-        self.print_status(f"Starting to parse URL: {url}", "info")
+        if len(urls) == 1:
+            self.print_status(f"Starting to parse URL: {urls[0]}", "info")
+        else:
+            self.print_status(f"Starting to parse {len(urls)} categories in batch mode", "info")
         self.print_status("Parameters:", "info")
         self.print_status(f"- Maximum pages: {max_pages}", "info")
         self.print_status(f"- Search all links: Enabled", "info")
         self.print_status(f"- Try API request: Enabled", "info")
-        self.print_status(f"- Delay: 0.5 seconds", "info")
+        self.print_status(f"- API delay: 0.5 seconds", "info")
+        self.print_status(f"- Concurrent page requests: {self.concurrency}", "info")
+        self.print_status(f"- Parse workers: {self.parse_workers or 'in-process'}", "info")
+        if len(self.session_pool) > 1:
+            self.print_status(f"- Sessions: {len(self.session_pool)}", "info")
+        if len(urls) > 1:
+            self.print_status(f"- Rate limit: {self.global_rate} req/s total, {self.host_rate} req/s per host", "info")
+        if self.streaming:
+            self.print_status(f"- Streaming results to: {self.output_path}", "info")
+        if self.online:
+            self.print_status(f"- In-crawl notifications after {self.notify_warmup} channels", "info")
+        if self.columnar_path:
+            self.print_status(f"- Columnar output: {self.columnar_path}", "info")
 
         try:
-            self.parse_url(url, max_pages)
+            if len(urls) == 1:
+                self.parse_url(urls[0], max_pages)
+            else:
+                self.parse_batch(urls, max_pages)
         except KeyboardInterrupt:
             self.print_status("\nParsing stopped by user.", "warning")
             self.stop_parsing = True
+        finally:
+            self.show_progress(force=True)
+            self.clear_progress()
+            self.save_checkpoint()
 
-        if self.links:
-            self.process_results()
+        if self.links or (self.stream is not None and self.stream.count):
+            try:
+                self.process_results()
+            finally:
+                self.flush_notifications()
         else:
             self.print_status("No Telegram channels found.", "warning")
+        self.close_columnar()
+        if self.history is not None:
+            self.history.close()
+            self.history = None
+        if self.metrics_cache is not None:
+            self.metrics_cache.close()
+            self.metrics_cache = None
+
+        self.report_metrics()
+
+        if all(self.progress.get(url, {}).get('mode') == 'done' for url in urls):
+            self.clear_checkpoint()
+            return True
+
+        self.print_status(f"Crawl incomplete, run with --resume to continue from {self.checkpoint_path}", "warning")
+        return False
+
+    def add_links(self, new_links, mode='html'):
+        added = []
+        usernames = set()
+        for link in new_links:
+            username = link.username()
+            if username not in self.seen_channels and username not in usernames:
+                usernames.add(username)
+                added.append(link)
+
+        if self.stream is not None:
+            self.stream.add(added)
+        else:
+            self.links.extend(added)
+
+        # Marked seen only once stored, so a page interrupted mid-enrichment is
+        # crawled again in full on --resume instead of being skipped as seen.
+        self.seen_channels.update(usernames)
+
+        self.metrics.add_page(mode, len(added))
+        self.show_progress()
+        return added
+
+    def repeated_page(self, url, mode, links):
+        # Some listings keep serving their last page for any larger ?page=N.
+        return page_fingerprint(links) in self.page_fingerprints.get(url, {}).get(mode, ())
+
+    def mark_progress(self, url, mode, page, links=None):
+        # The fingerprint is recorded together with the progress it belongs to, so
+        # a page that was interrupted before being stored isn't a "repeat" on --resume.
+        if links is not None:
+            self.page_fingerprints.setdefault(url, {}).setdefault(mode, set()).add(page_fingerprint(links))
+        self.progress[url] = {'mode': mode, 'page': page}
+
+        self.pages_since_checkpoint += 1
+        if self.pages_since_checkpoint >= self.checkpoint_every:
+            self.save_checkpoint()
+
+    def resume_point(self, url):
+        state = self.progress.get(url)
+        if state is None:
+            return 'api', 1
+        return state['mode'], state['page'] + 1
+
+    def save_checkpoint(self):
+        state = {
+            'urls': self.urls,
+            'max_pages': self.max_pages,
+            'progress': self.progress,
+            'links': [link.to_dict() for link in self.links],
+            'seen_channels': list(self.seen_channels),
+            'page_fingerprints': {
+                url: {mode: list(fingerprints) for mode, fingerprints in modes.items()}
+                for url, modes in self.page_fingerprints.items()
+            },
+            'streaming': self.streaming,
+            'stream': self.stream.state() if self.stream is not None else None,
+            'run_at': self.run_at,
+            'online': self.online,
+            'notified_channels': list(self.notified_channels),
+        }
+
+        try:
+            tmp_path = self.checkpoint_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp_path, self.checkpoint_path)
+            self.pages_since_checkpoint = 0
+        except Exception as e:
+            self.print_status(f"Failed to save checkpoint: {e}", "error")
+
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            self.print_status(f"No checkpoint found at {self.checkpoint_path}", "error")
+            return False
+        except ValueError as e:
+            self.print_status(f"Checkpoint {self.checkpoint_path} is corrupt: {e}", "error")
+            return False
+
+        self.urls = state['urls']
+        self.max_pages = state['max_pages']
+        self.progress = state['progress']
+        self.links = [Channel.from_dict(link) for link in state['links']]
+        self.seen_channels = set(state['seen_channels'])
+        self.page_fingerprints = {
+            url: {mode: set(fingerprints) for mode, fingerprints in modes.items()}
+            for url, modes in state.get('page_fingerprints', {}).items()
+        }
+        self.streaming = state.get('streaming', False)
+        self.stream_state = state.get('stream')
+        self.run_at = state.get('run_at') or time.time()
+        self.online = state.get('online', False)
+        self.notified_channels = set(state.get('notified_channels', []))
+
+        done = sum(1 for state in self.progress.values() if state['mode'] == 'done')
+        collected = self.stream_state['count'] if self.stream_state else len(self.links)
+        self.print_status(
+            f"Resuming from checkpoint: {collected} channels collected, "
+            f"{done}/{len(self.urls)} categories finished",
+            "info"
+        )
+        return True
+
+    def clear_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
 
     def parse_url(self, url, max_pages):
         try:
-            if not url.startswith(('http://', 'https://')):
-                url = 'https://' + url
+            url = normalize_url(url)
 
             parsed_url = urlparse(url)
             base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
 
             delay = 0.5
 
-            current_page = 1
-            total_links = 0
+            mode, start_page = self.resume_point(url)
+            if mode == 'done':
+                self.print_status(f"{url} already finished in the checkpoint, skipping", "info")
+                return
 
-            self.print_status("Trying to use API for data retrieval...", "info")
+            if mode == 'api':
+                self.print_status("Trying to use API for data retrieval...", "info")
 
-            api_success = self.parse_via_api(url, max_pages, delay)
+                if self.parse_via_api(url, max_pages, delay, start_page):
+                    return
 
-            if not api_success:
                 self.print_status("API failed, switching to regular parsing...", "warning")
+                start_page = 1
 
-                while current_page <= max_pages and not self.stop_parsing:
-                    page_url = url
-                    if current_page > 1:
-                        if "?" in url:
-                            page_url = f"{url}&page={current_page}"
-                        else:
-                            page_url = f"{url}?page={current_page}"
+            self.parse_pages(url, base_url, max_pages, start_page)
 
-                    self.print_status(f"Processing page {current_page}...", "progress")
+        except Exception as e:
+            import traceback
+            error_details = traceback.format_exc()
+            self.print_status(f"Error: {str(e)}", "error")
+            self.print_status(f"Details:\n{error_details}", "error")
 
-                    response = self.session.get(page_url, timeout=30)
-                    response.raise_for_status()
+    def configure_cache(self):
+        mode = input("Response cache (on/off/offline) [on]: ").lower().strip() or "on"
+        if mode == "off":
+            self.print_status("Response cache disabled", "warning")
+            return
 
-                    soup = BeautifulSoup(response.text, 'html.parser')
+        self.enable_cache(offline=(mode == "offline"))
 
-                    new_links = self.extract_links_from_soup(soup, base_url)
+    def enable_cache(self, offline=False):
+        self.cache = ResponseCache(self.cache_path, self.cache_max_bytes)
+        self.offline = offline
 
-                    if not new_links and current_page > 1:
-                        self.print_status(f"Page {current_page} has no new links. Finishing parsing.", "info")
-                        break
+        size_mb = self.cache.total_bytes / (1024 * 1024)
+        if offline:
+            self.print_status(f"Offline mode: serving only cached responses ({size_mb:.1f} MB cached)", "warning")
+        else:
+            self.print_status(f"Response cache enabled: {self.cache_path} ({size_mb:.1f} MB cached)", "info")
 
-                    self.links.extend(new_links)
-                    total_links += len(new_links)
+    def request_url(self, url, params=None):
+        import requests
 
-                    self.print_status(f"Found {total_links} links (page {current_page})", "success")
+        return requests.Request('GET', url, params=params).prepare().url
 
-                    current_page += 1
+    def cached(self, url, params=None, endpoint='html'):
+        if self.cache is None:
+            return None
 
-                    if current_page <= max_pages and not self.stop_parsing:
-                        time.sleep(delay)
+        entry = self.cache.get(self.request_url(url, params))
+        if entry is not None and self.is_fresh(entry, endpoint):
+            return cached_response(entry)
 
-        except Exception as e:
-            import traceback
-            error_details = traceback.format_exc()
-            self.print_status(f"Error: {str(e)}", "error")
-            self.print_status(f"Details:\n{error_details}", "error")
+        return None
+
+    def is_fresh(self, entry, endpoint):
+        return self.offline or time.time() - entry['stored_at'] < self.cache_ttls.get(endpoint, 0)
+
+    def fetch(self, url, params=None, endpoint='html'):
+        start = time.perf_counter()
+        try:
+            response = self.conditional_fetch(url, params, endpoint)
+        except Exception:
+            self.metrics.observe_request(endpoint, time.perf_counter() - start, None)
+            raise
+
+        self.metrics.observe_request(endpoint, time.perf_counter() - start, response)
+        return response
+
+    def conditional_fetch(self, url, params=None, endpoint='html'):
+        if self.cache is None or endpoint not in self.cache_ttls:
+            return self.send_request(url, params=params, endpoint=endpoint)
+
+        full_url = self.request_url(url, params)
+        entry = self.cache.get(full_url)
+
+        if entry is not None and self.is_fresh(entry, endpoint):
+            return cached_response(entry)
+
+        if self.offline:
+            return offline_miss(full_url)
+
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = self.send_request(full_url, headers=headers, endpoint=endpoint)
+
+        if response.status_code == 304 and entry is not None:
+            self.cache.refresh(full_url)
+            response = cached_response(entry)
+            response.revalidated = True
+            return response
+
+        if response.status_code == 200:
+            self.cache.put(full_url, response)
+
+        return response
+
+    def send_request(self, url, params=None, headers=None, stream_body=False, endpoint='html'):
+        # Bodies are always downloaded in chunks and capped at max_body_bytes;
+        # with stream_body the caller reads them itself through body_chunks.
+        host = urlparse(url).netloc
+        bucket = 'api' if endpoint == 'api' else 'html'
+        pool = self.session_pool
+        attempt = 0
+
+        while True:
+            pooled = pool.acquire(host, bucket, self.breaker)
+            key = (pooled.name, host)
+
+            response = error = None
+            try:
+                response = pooled.session.get(url, params=params, headers=headers, stream=True,
+                                              timeout=(self.connect_timeout, self.read_timeout))
+                if response.status_code not in RETRY_STATUSES and not stream_body:
+                    read_body(response, self.max_body_bytes)
+            except transport_errors() as e:
+                error = e
+                response = None
+            finally:
+                pool.release(pooled)
+
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                self.breaker.success(key)
+                return response
+
+            pause = self.breaker.failure(key)
+            if pause and len(pool) > 1:
+                self.print_status(f"Session {pooled.name} keeps failing on {host}, quarantined for {pause}s", "warning")
+            elif pause:
+                self.print_status(f"{host} keeps failing, pausing requests to it for {pause}s", "warning")
+
+            if attempt >= self.max_retries:
+                if response is None:
+                    raise error
+                return response if stream_body else read_body(response, self.max_body_bytes)
+
+            if response is not None:
+                response.close()
+
+            delay = retry_after(response) if response is not None else None
+            if delay is None:
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+
+            # Only the failing session waits; other sessions in the pool can take the retry.
+            self.metrics.add_retry()
+            pool.hold(pooled, min(delay, self.retry_after_cap))
+            attempt += 1
+
+    def page_url(self, url, page):
+        if page == 1:
+            return url
+        if "?" in url:
+            return f"{url}&page={page}"
+        return f"{url}?page={page}"
+
+    def parse_streamed(self, url, base_url):
+        # Pages are parsed while they download, so no page is ever held whole.
+        # These requests bypass the response cache, which stores full bodies.
+        start = time.perf_counter()
+        parse_seconds = 0.0
+        response = None
+        try:
+            response = self.send_request(url, stream_body=True)
+            response.raise_for_status()
+
+            page_parser = IncrementalPageParser(base_url, declared_charset(response.headers.get('Content-Type')))
+            for chunk in body_chunks(response, self.max_body_bytes):
+                parse_start = time.perf_counter()
+                page_parser.feed_bytes(chunk)
+                parse_seconds += time.perf_counter() - parse_start
+
+            parse_start = time.perf_counter()
+            links, card_count = page_parser.finish()
+            parse_seconds += time.perf_counter() - parse_start
+        except Exception:
+            self.metrics.observe_request('html', time.perf_counter() - start - parse_seconds, None)
+            raise
+        finally:
+            if response is not None:
+                response.close()
+
+        self.metrics.observe_request('html', time.perf_counter() - start - parse_seconds, response)
+        return links, card_count, parse_seconds
+
+    def fetch_page(self, page_url, parse_pool, base_url):
+        if self.incremental:
+            future = Future()
+            future.set_result(self.parse_streamed(page_url, base_url))
+            return future
+
+        response = self.fetch(page_url, endpoint='html')
+        response.raise_for_status()
+
+        return parse_pool.submit(timed_parse_page, response.content, base_url)
+
+    def parse_pages(self, url, base_url, max_pages, start_page=1):
+        # Pages are fetched ahead by a bounded thread pool and handed straight to
+        # the parse pool, so downloads and BeautifulSoup work overlap. Results are
+        # still consumed strictly in page order.
+        fetch_pool = ThreadPoolExecutor(max_workers=self.concurrency)
+        if self.parse_workers > 0:
+            parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+        else:
+            parse_pool = ThreadPoolExecutor(max_workers=1)
+
+        window = self.concurrency * 2
+        pending = {}
+        next_page = start_page
+        current_page = start_page
+        failed = False
 
-    def parse_via_api(self, url, max_pages, delay):
         try:
-            category = url.split('/')[-1]
+            while current_page <= max_pages and not self.stop_parsing:
+                while next_page <= max_pages and next_page < current_page + window:
+                    page_url = self.page_url(url, next_page)
+                    pending[next_page] = fetch_pool.submit(self.fetch_page, page_url, parse_pool, base_url)
+                    next_page += 1
+
+                try:
+                    new_links, _, parse_seconds = pending.pop(current_page).result().result()
+                except Exception as e:
+                    reason = "failed after retries" if retries_exhausted(e) else "failed"
+                    self.print_status(f"Page {current_page} {reason}: {e}", "error")
+                    failed = True
+                    break
+                self.metrics.observe_parse(parse_seconds)
+
+                if not new_links and current_page > 1:
+                    self.print_status(f"Page {current_page} has no new links. Finishing parsing.", "info")
+                    break
+
+                if self.repeated_page(url, 'html', new_links):
+                    self.print_status(f"Page {current_page} repeats an earlier page. Finishing parsing.", "info")
+                    break
+
+                self.add_links(new_links)
+                self.mark_progress(url, 'html', current_page, new_links)
 
-            api_url = f"https://tgstat.ru/channels/list/{category}"
+                current_page += 1
+
+            if not self.stop_parsing and not failed:
+                self.mark_progress(url, 'done', current_page)
+        finally:
+            fetch_pool.shutdown(wait=False, cancel_futures=True)
+            parse_pool.shutdown(wait=False, cancel_futures=True)
+
+    def api_url(self, url):
+        category = url.rstrip('/').split('/')[-1]
+        return f"{self.api_base}/channels/list/{category}"
+
+    def parse_batch(self, urls, max_pages):
+        import asyncio
+
+        crawler_results = asyncio.run(self.crawl_batch(urls, max_pages))
+
+        for url, links in crawler_results.items():
+            self.print_status(f"{url}: {len(links)} channels", "info")
+
+    async def crawl_batch(self, urls, max_pages):
+        crawler = BatchCrawler(self, max_pages)
+        return await crawler.run(urls)
+
+    def parse_via_api(self, url, max_pages, delay, start_page=1):
+        try:
+            api_url = self.api_url(url)
 
-            total_links = 0
-            current_page = 1
+            current_page = start_page
 
             while current_page <= max_pages and not self.stop_parsing:
-                self.print_status(f"API request: page {current_page}...", "progress")
+                params = api_params(current_page)
+
+                response = self.fetch(api_url, params=params, endpoint='api')
 
-                params = {
-                    'page': current_page,
-                    'sort': 'members',
-                    'extended': 1
-                }
+                # Nothing was sent, so unlike a 504 from the server this isn't an outage.
+                if getattr(response, 'offline_miss', False):
+                    self.print_status(f"API page {current_page} is not cached (offline mode)", "warning")
+                    return False
 
-                response = self.session.get(api_url, params=params, timeout=30)
+                if response.status_code in RETRY_STATUSES:
+                    self.print_status(f"API still returns {response.status_code} after retries, "
+                                      f"stopping at page {current_page}", "error")
+                    return True
 
                 if response.status_code != 200:
                     self.print_status(f"API returned error: {response.status_code}", "error")
@@ -214,31 +3568,19 @@ class TGStatCmdParser:
                     self.print_status("API returned unexpected data format", "error")
                     return False
 
-                new_links = []
-                for item in data['items']:
-                    if 'username' in item and item['username']:
-                        username = item['username']
-                        title = item.get('title', username)
-                        members = item.get('members', 0)
-
-                        new_links.append({
-                            'url': f"https://t.me/{username}",
-                            'text': title,
-                            'members': members,
-                            'description': item.get('description', ''),
-                            'category': item.get('category', ''),
-                            'avg_post_reach': item.get('avg_post_reach', 0),
-                            'citations': item.get('citations', 0)
-                        })
+                with self.metrics.timer('extract'):
+                    new_links = extract_api_links(data)
 
                 if not new_links and current_page > 1:
                     self.print_status(f"API: page {current_page} has no new channels. Finishing.", "info")
                     break
 
-                self.links.extend(new_links)
-                total_links += len(new_links)
+                if self.repeated_page(url, 'api', new_links):
+                    self.print_status(f"API: page {current_page} repeats an earlier page. Finishing.", "info")
+                    break
 
-                self.print_status(f"API: found {total_links} channels (page {current_page})", "success")
+                self.add_links(new_links, 'api')
+                self.mark_progress(url, 'api', current_page, new_links)
 
                 if 'pagination' in data and 'has_next' in data['pagination']:
                     if not data['pagination']['has_next']:
@@ -247,285 +3589,379 @@ class TGStatCmdParser:
 
                 current_page += 1
 
-                if current_page <= max_pages and not self.stop_parsing:
+                if current_page <= max_pages and not self.stop_parsing and not getattr(response, 'from_cache', False):
                     time.sleep(delay)
 
+            if not self.stop_parsing:
+                self.mark_progress(url, 'done', current_page)
             return True
 
         except Exception as e:
+            # Like a retryable status that outlasted the retries, an unreachable API
+            # stops the category without downgrading it; --resume retries it.
+            if retries_exhausted(e):
+                self.print_status(f"API unreachable after retries, stopping at page {current_page}: {e}", "error")
+                return True
             self.print_status(f"Error using API: {str(e)}", "error")
             return False
 
     def extract_links_from_soup(self, soup, base_url):
-        all_links = []
+        links, card_count = extract_links(soup, base_url)
 
-        channel_cards = soup.find_all(class_=["channel-card", "channel-item"])
+        if card_count:
+            self.print_status(f"Found {card_count} channel cards", "info")
 
-        if channel_cards:
-            self.print_status(f"Found {len(channel_cards)} channel cards", "info")
+        return links
 
-            for card in channel_cards:
-                a_tag = card.find('a', href=True)
-                if not a_tag:
-                    continue
+    def analyze_channel(self, channel):
+        score, reasons = channel_tiers(channel.members or 0, channel.avg_post_reach, channel.citations,
+                                       len(channel.description))
+        channel.score = score
+        channel.reasons = reasons
+
+        return {
+            'score': score,
+            'analysis': channel.analysis()
+        }
 
-                href = a_tag.get('href', '')
+    def process_results(self):
+        if self.stream is not None:
+            self.stream.close()
 
-                if '/channel/' in href:
-                    channel_parts = href.split('/')
-                    if len(channel_parts) > 1:
-                        channel_name = channel_parts[-1]
+            if not self.stream.count:
+                self.print_status("No Telegram links found.", "warning")
+                return
 
-                        tg_url = f"https://t.me/{channel_name}"
+            self.ranked = self.stream.top()
+            self.print_results_header(self.stream.count)
+            self.report_duplicates()
+            if self.stream.online is not None:
+                scores = self.stream.online.scores
+                self.print_status(
+                    f"Score distribution: median {scores.quantile(0.5)}, p90 {scores.quantile(0.9)}, "
+                    f"p99 {scores.quantile(0.99)}", "info"
+                )
+            notify_above = None
+            if self.stream.online is not None:
+                # The final report holds channels to the same bar as the in-crawl notifications.
+                bar = self.stream.online.bar()
+                notify_above = bar if bar is not None else float('inf')
+            self.report_top_channels(self.ranked, self.stream.average(), notify_above)
+            self.report_changes()
+            self.print_status(f"Results saved to file: {os.path.abspath(self.stream.filename)}", "success")
+            self.close_columnar()
+            return
 
-                        title_elem = card.find(class_=["channel-name", "channel-title"])
-                        title = title_elem.get_text(strip=True) if title_elem else channel_name
+        if not self.links:
+            self.print_status("No Telegram links found.", "warning")
+            return
 
-                        members_elem = card.find(class_=["channel-members", "members"])
-                        members = members_elem.get_text(strip=True) if members_elem else "Unknown"
+        self.print_results_header(len(self.links))
 
-                        desc_elem = card.find(class_=["channel-description", "description"])
-                        description = desc_elem.get_text(strip=True) if desc_elem else ""
+        self.enrich_channels(self.links)
+        scores = self.score_channels(self.links)
 
-                        cat_elem = card.find(class_=["channel-category", "category"])
-                        category = cat_elem.get_text(strip=True) if cat_elem else ""
+        channels_with_scores = self.mark_duplicates([self.links[i] for i in rank_order(scores)])
+        self.ranked = channels_with_scores
+        self.report_duplicates()
 
-                        all_links.append({
-                            'url': tg_url,
-                            'text': title,
-                            'members': members,
-                            'description': description,
-                            'category': category
-                        })
+        unique = [channel for channel in channels_with_scores if channel.duplicate_of is None]
+        avg_score = sum(channel.score for channel in unique) / len(unique)
 
-        if not all_links:
-            a_tags = soup.find_all('a', href=True)
+        with self.metrics.timer('write'):
+            self.record_history(channels_with_scores)
+        self.report_top_channels(unique[:10], avg_score)
+        self.report_changes()
 
-            for a in a_tags:
-                href = a.get('href', '')
+        self.save_to_csv(channels_with_scores)
+        self.save_columnar(channels_with_scores)
 
-                if 't.me/' in href or 'telegram.me/' in href:
-                    link_text = a.get_text(strip=True)
-                    if not link_text:
-                        link_text = a.get('title', '') or href
+    def mark_duplicates(self, channels):
+        # Channels must already be scored. Each is flagged with the best-scoring
+        # channel of its near-duplicate cluster, or dropped in 'drop' mode. Mirrors
+        # stay out of the top list, the average score and notifications.
+        if self.duplicates is None:
+            return channels
 
-                    all_links.append({
-                        'url': href,
-                        'text': link_text
-                    })
-                elif '/channel/' in href:
-                    if href.startswith('/'):
-                        href = urljoin(base_url, href)
+        for channel in channels:
+            self.duplicates.add(channel)
 
-                    channel_parts = href.split('/')
-                    if len(channel_parts) > 1:
-                        channel_name = channel_parts[-1]
-                        tg_url = f"https://t.me/{channel_name}"
+        for channel in channels:
+            best = self.duplicates.best_url(channel)
+            channel.duplicate_of = best if best not in (None, channel.url) else None
+            self.mirror_count += channel.duplicate_of is not None
 
-                        link_text = a.get_text(strip=True)
-                        if not link_text:
-                            link_text = a.get('title', '') or channel_name
+        if self.dedup == 'drop':
+            return [channel for channel in channels if channel.duplicate_of is None]
+        return channels
 
-                        all_links.append({
-                            'url': tg_url,
-                            'text': link_text
-                        })
+    def report_duplicates(self):
+        if self.mirror_count:
+            action = "dropped" if self.dedup == 'drop' else "flagged"
+            self.print_status(f"{self.mirror_count} near-duplicate channels {action}", "info")
+        if self.duplicates is not None and self.duplicates.full:
+            self.print_status(f"Near-duplicate tracking stopped after {self.duplicates.max_channels:,} channels "
+                              f"(--dedup-max)", "warning")
 
-        if not all_links:
-            html_text = str(soup)
+    def dedup_limit(self):
+        if self.dedup_max is not None:
+            return self.dedup_max
+        return DEDUP_STREAM_MAX_CHANNELS if self.streaming else DEDUP_MAX_CHANNELS
 
-            tg_links_pattern = r'(https?://)?(t\.me|telegram\.me)/([a-zA-Z0-9_]+)'
-            tg_links = re.findall(tg_links_pattern, html_text)
+    def channel_stats_url(self, channel):
+        return f"{self.api_base}/channel/@{channel.username()}/stat"
 
-            for protocol, domain, username in tg_links:
-                if not protocol:
-                    protocol = "https://"
+    def fetch_channel_stats(self, channel):
+        try:
+            response = self.fetch(self.channel_stats_url(channel), endpoint='channel')
+            if response.status_code != 200:
+                return None
+            return parse_channel_stats(response.content)
+        except Exception as e:
+            self.print_status(f"Failed to fetch stats for {channel.url}: {e}", "warning")
+            return None
 
-                full_url = f"{protocol}{domain}/{username}"
+    def enrich_channels(self, channels, min_score=None):
+        # Channels from HTML pages have no reach or citation numbers. The ones most
+        # likely to rank are picked by their members/description score alone, and
+        # only those are looked up, cached first, then fetched within the run's budget.
+        # API records carry real numbers, even when those are 0.
+        candidates = [channel for channel in channels
+                      if channel.source_mode == 'html' and not channel.avg_post_reach and not channel.citations]
+        if not candidates or self.enrich_top <= 0:
+            return 0
 
-                if not any(link['url'] == full_url for link in all_links):
-                    all_links.append({
-                        'url': full_url,
-                        'text': f"@{username}"
-                    })
+        with self.metrics.timer('enrich'):
+            pre_scores = self.score_channels(candidates)
+            order = rank_order(pre_scores)[:self.enrich_top]
+            if min_score is not None:
+                order = [i for i in order if pre_scores[i] + MAX_ENRICH_POINTS > min_score]
+            candidates = [candidates[i] for i in order]
+            if not candidates:
+                return 0
 
-        unique_links = []
-        seen_urls = set()
+            metrics_cache = self.metrics_cache
+            known = {}
+            if metrics_cache is not None:
+                try:
+                    known = metrics_cache.get_many((channel.username() for channel in candidates), self.offline)
+                except Exception as e:
+                    self.print_status(f"Channel metrics cache unavailable: {e}", "warning")
 
-        for link in all_links:
-            url = link['url']
-            if url not in seen_urls:
-                seen_urls.add(url)
-                unique_links.append(link)
+            missing = [channel for channel in candidates if channel.username() not in known]
+            if self.offline:
+                missing = []
+            missing = missing[:max(0, self.enrich_budget - self.enrich_spent)]
+            self.enrich_spent += len(missing)
 
-        return unique_links
+            fetched = {}
+            if missing:
+                with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                    for channel, stats in zip(missing, pool.map(self.fetch_channel_stats, missing)):
+                        if stats is not None:
+                            fetched[channel.username()] = stats
 
-    def analyze_channel(self, channel):
-        score = 0
-        analysis = []
-
-        members = channel.get('members', 0)
-        if isinstance(members, str):
-            if 'K' in members:
-                members = float(members.replace('K', '')) * 1000
-            elif 'M' in members:
-                members = float(members.replace('M', '')) * 1000000
-            else:
+            if metrics_cache is not None and fetched:
                 try:
-                    members = float(''.join(filter(lambda x: x.isdigit() or x == '.', members)))
-                except:
-                    members = 0
-
-        if members > 100000:
-            score += 30
-            analysis.append("Large audience (100K+ subscribers)")
-        elif members > 50000:
-            score += 25
-            analysis.append("Good size audience (50K+ subscribers)")
-        elif members > 10000:
-            score += 15
-            analysis.append("Medium size audience (10K+ subscribers)")
-        else:
-            score += 5
-            analysis.append("Small audience (less than 10K subscribers)")
-
-        avg_reach = channel.get('avg_post_reach', 0)
-        if avg_reach > 0:
-            engagement_rate = (avg_reach / members) * 100 if members > 0 else 0
-            if engagement_rate > 30:
-                score += 35
-                analysis.append(f"Excellent engagement rate ({engagement_rate:.1f}%)")
-            elif engagement_rate > 20:
-                score += 25
-                analysis.append(f"Very good engagement rate ({engagement_rate:.1f}%)")
-            elif engagement_rate > 10:
-                score += 15
-                analysis.append(f"Good engagement rate ({engagement_rate:.1f}%)")
-            else:
-                score += 5
-                analysis.append(f"Low engagement rate ({engagement_rate:.1f}%)")
-
-        citations = channel.get('citations', 0)
-        if citations > 1000:
-            score += 20
-            analysis.append("Highly cited channel (1000+ citations)")
-        elif citations > 500:
-            score += 15
-            analysis.append("Well cited channel (500+ citations)")
-        elif citations > 100:
-            score += 10
-            analysis.append("Moderately cited channel (100+ citations)")
-        elif citations > 0:
-            score += 5
-            analysis.append("Some citations")
-
-        description = channel.get('description', '')
-        if len(description) > 200:
-            score += 10
-            analysis.append("Detailed channel description")
-        elif len(description) > 100:
-            score += 7
-            analysis.append("Good channel description")
-        elif len(description) > 50:
-            score += 5
-            analysis.append("Basic channel description")
-        else:
-            analysis.append("Minimal or no description")
+                    metrics_cache.put_many(fetched)
+                except Exception as e:
+                    self.print_status(f"Failed to cache channel metrics: {e}", "warning")
 
-        score = min(score, 100)
+            known.update(fetched)
+            enriched = 0
+            for channel in candidates:
+                stats = known.get(channel.username())
+                if not stats:
+                    continue
 
-        return {
-            'score': score,
-            'analysis': analysis
-        }
+                channel.avg_post_reach = stats.get('avg_post_reach') or 0
+                channel.citations = stats.get('citations') or 0
+                if channel.members is None and stats.get('members') is not None:
+                    channel.members = stats['members']
+                enriched += 1
 
-    def process_results(self):
-        if not self.links:
-            self.print_status("No Telegram links found.", "warning")
+        if min_score is None:
+            self.print_status(
+                f"Enriched {enriched} of {len(candidates)} top candidates with reach and citations "
+                f"({len(missing)} stat pages requested)",
+                "info"
+            )
+        return enriched
+
+    def score_channels(self, channels):
+        with self.metrics.timer('score'):
+            scores, reasons, _ = score_columns(*channel_columns(channels))
+            if not isinstance(scores, list):
+                scores = scores.tolist()
+                reasons = reasons.tolist()
+
+            for channel, score, code in zip(channels, scores, reasons):
+                channel.score = score
+                channel.reasons = code
+
+        return scores
+
+    def print_results_header(self, channel_count):
+        if self.quiet:
             return
 
         print(f"\n{Fore.CYAN}{'=' * 60}")
         print(f"{Fore.WHITE}{Style.BRIGHT}          Results Analysis")
         print(f"{Fore.CYAN}{'=' * 60}{Style.RESET_ALL}")
 
-        self.print_status(f"Found {len(self.links)} Telegram channels", "success")
+        self.print_status(f"Found {channel_count} Telegram channels", "success")
 
-        total_score = 0
-        channels_with_scores = []
+    def report_top_channels(self, top_channels, avg_score, notify_above=None):
+        self.print_status(f"Average channel quality score: {avg_score:.1f}/100", "info")
 
-        for channel in self.links:
-            analysis_result = self.analyze_channel(channel)
-            channel['analysis'] = analysis_result
-            total_score += analysis_result['score']
-            channels_with_scores.append(channel)
+        previous = self.previous_snapshots(top_channels)
+        if notify_above is None:
+            notify_above = avg_score * (1 + self.ai_threshold / 100)
 
-        avg_score = total_score / len(channels_with_scores) if channels_with_scores else 0
-        self.print_status(f"Average channel quality score: {avg_score:.1f}/100", "info")
+        if not self.quiet:
+            print(f"\n{Fore.GREEN}Top 10 channels for advertisers:{Style.RESET_ALL}")
 
-        channels_with_scores.sort(key=lambda x: x['analysis']['score'], reverse=True)
-
-        print(f"\n{Fore.GREEN}Top 10 channels for advertisers:{Style.RESET_ALL}")
-        for i, channel in enumerate(channels_with_scores[:10]):
-            score = channel['analysis']['score']
-            name = channel['text']
-            url = channel['url']
-            members = channel.get('members', 'Unknown')
-
-            score_color = Fore.RED
-            if score >= 80:
-                score_color = Fore.GREEN
-            elif score >= 60:
-                score_color = Fore.YELLOW
-
-            print(f"{i + 1}. {name} - {score_color}Score: {score:.1f}/100{Style.RESET_ALL}")
-            print(f"   URL: {url}")
-            print(f"   Subscribers: {members}")
-            print(f"   Analysis: {', '.join(channel['analysis']['analysis'])}")
-            print()
-
-            if score > (avg_score * (1 + self.ai_threshold / 100)) and self.telegram_enabled:
-                percent_above_avg = ((score / avg_score) - 1) * 100
-                message = (
-                    f"<b>🔥 High-Quality Channel Found!</b>\n\n"
-                    f"Channel: <b>{name}</b>\n"
-                    f"URL: {url}\n"
-                    f"Subscribers: {members}\n"
-                    f"Quality Score: {score:.1f}/100 "
-                    f"(<b>{percent_above_avg:.1f}%</b> above average)\n\n"
-                    f"Analysis:\n"
-                    f"- {chr(10).join(channel['analysis']['analysis'])}"
-                )
+        for i, channel in enumerate(top_channels):
+            score = channel.score
+            name = channel.text
+            url = channel.url
+            members = channel.members_label()
+            analysis = channel.analysis()
 
-                self.send_telegram_message(message)
-                self.print_status(f"Notification sent to Telegram for high-quality channel: {name}", "success")
+            if not self.quiet:
+                score_color = Fore.RED
+                if score >= 80:
+                    score_color = Fore.GREEN
+                elif score >= 60:
+                    score_color = Fore.YELLOW
 
-        self.save_to_csv(channels_with_scores)
+                print(f"{i + 1}. {name} - {score_color}Score: {score:.1f}/100{Style.RESET_ALL}")
+                print(f"   URL: {url}")
+                print(f"   Subscribers: {members}")
+                print(f"   Analysis: {', '.join(analysis)}")
+                if previous is not None:
+                    print(f"   Since last run: {delta_text(channel_delta(channel, previous.get(channel.username())))}")
+                print()
+
+            if score > notify_above:
+                self.notify_channel(channel, avg_score, previous)
+
+    def notify_channel(self, channel, avg_score, previous=None):
+        username = channel.username()
+        if not self.telegram_enabled or username in self.notified_channels:
+            return False
+
+        delta = channel_delta(channel, previous.get(username)) if previous is not None else None
+        if previous is not None and not self.worth_notifying(delta):
+            return False
+
+        score = channel.score
+        name = channel.text
+        percent_above_avg = ((score / avg_score) - 1) * 100 if avg_score else 0
+        header = (
+            f"<b>🔥 High-Quality Channel Found!</b>\n\n"
+            f"Channel: <b>{html.escape(name, quote=False)}</b>\n"
+            f"URL: {html.escape(channel.url)}\n"
+            f"Subscribers: {channel.members_label()}\n"
+            f"Quality Score: {score:.1f}/100 "
+            f"(<b>{percent_above_avg:.1f}%</b> above average)\n\n"
+            f"Analysis:\n"
+            f"- "
+        )
+        footer = f"\n\nSince last run: {delta_text(delta)}" if previous is not None else ""
+        # The analysis is the free-form part, so it is what gets cut to fit one message.
+        analysis = clip_html_text(chr(10).join(channel.analysis()), TELEGRAM_MESSAGE_LIMIT - len(header) - len(footer))
+        message = header + analysis + footer
+
+        self.notified_channels.add(username)
+        self.send_telegram_message(message)
+        self.print_status(f"Notification queued for high-quality channel: {name}", "success")
+        return True
+
+    def previous_snapshots(self, channels):
+        if self.history is None or not self.history.has_earlier_run(self.run_at):
+            return None
+        return self.history.previous(self.run_at, [channel.username() for channel in channels])
+
+    def worth_notifying(self, delta):
+        # Channels already reported are only re-sent when they improved noticeably.
+        if delta is None or delta['score'] > 0:
+            return True
+        if not delta['members_before']:
+            return delta['members'] > 0
+        return delta['members'] / delta['members_before'] * 100 >= self.growth_threshold
+
+    def report_changes(self, limit=5):
+        if self.history is None or not self.history.has_earlier_run(self.run_at):
+            return
+
+        new = grew = shrank = 0
+        growers = []
+        for username, url, title, members, members_before, *_, run_before in self.history.changes(self.run_at):
+            if run_before is None:
+                new += 1
+                continue
+
+            change = (members or 0) - (members_before or 0)
+            if change > 0:
+                grew += 1
+                entry = (change, username, title, url)
+                if len(growers) < limit:
+                    heapq.heappush(growers, entry)
+                elif entry > growers[0]:
+                    heapq.heapreplace(growers, entry)
+            elif change < 0:
+                shrank += 1
+
+        self.print_status(f"Since last run: {new} new channels, {grew} grew, {shrank} shrank", "info")
+        if self.quiet or not growers:
+            return
+
+        print(f"\n{Fore.GREEN}Fastest growing channels:{Style.RESET_ALL}")
+        for change, username, title, url in sorted(growers, reverse=True):
+            print(f"   {title} ({url}): {change:+,d} subscribers")
+        print()
+
+    def open_history(self):
+        try:
+            return HistoryStore(self.history_path)
+        except Exception as e:
+            self.print_status(f"Failed to open history store {self.history_path}: {e}", "error")
+            return None
+
+    def open_metrics_cache(self):
+        try:
+            return ChannelMetricsCache(self.cache_path, self.enrich_ttl)
+        except Exception as e:
+            self.print_status(f"Channel metrics cache unavailable: {e}", "warning")
+            return None
+
+    def record_history(self, channels):
+        if self.history is None or not channels:
+            return
+
+        try:
+            self.history.record(self.run_at, channels)
+        except Exception as e:
+            self.print_status(f"Failed to record channel history: {e}", "error")
 
     def save_to_csv(self, channels):
         """Save results to CSV"""
+        if self.output_path is None:
+            return
+
         if not channels:
             self.print_status("No data to save", "error")
             return
 
         try:
-            filename = "tgstat_links.csv"
-            with open(filename, 'w', newline='', encoding='utf-8-sig') as csvfile:
-                # Define fields for CSV
-                fieldnames = ['url', 'text', 'members', 'description', 'category', 'quality_score', 'analysis']
-
+            filename = self.output_path
+            with self.metrics.timer('write'), open(filename, 'w', newline='', encoding='utf-8-sig') as csvfile:
                 writer = csv.writer(csvfile)
-                writer.writerow(fieldnames)
+                writer.writerow(CSV_FIELDS)
 
                 for channel in channels:
-                    writer.writerow([
-                        channel.get('url', ''),
-                        channel.get('text', ''),
-                        channel.get('members', ''),
-                        channel.get('description', ''),
-                        channel.get('category', ''),
-                        channel['analysis'].get('score', 0),
-                        '; '.join(channel['analysis'].get('analysis', []))
-                    ])
+                    writer.writerow(csv_row(channel))
 
             full_path = os.path.abspath(filename)
             self.print_status(f"Results saved to file: {full_path}", "success")
@@ -533,12 +3969,342 @@ class TGStatCmdParser:
         except Exception as e:
             self.print_status(f"Failed to save results: {e}", "error")
 
+    def open_columnar(self, append=False):
+        if optional_import('pyarrow') is None:
+            self.print_status("pyarrow is not installed, skipping columnar output", "error")
+            return None
+
+        try:
+            return ColumnarWriter(self.columnar_path, append=append)
+        except Exception as e:
+            self.print_status(f"Failed to open columnar output: {e}", "error")
+            return None
+
+    def save_columnar(self, channels):
+        if not self.columnar_path or not channels:
+            return
+
+        self.columnar = self.open_columnar()
+        if self.columnar is None:
+            return
+
+        with self.metrics.timer('write'):
+            self.columnar.add(channels)
+        self.close_columnar()
+
+    def close_columnar(self):
+        if self.columnar is None:
+            return
+
+        columnar = self.columnar
+        self.columnar = None
+        try:
+            with self.metrics.timer('write'):
+                columnar.close()
+            self.print_status(
+                f"Columnar results saved to file: {os.path.abspath(columnar.path)} ({columnar.count} rows)", "success"
+            )
+        except Exception as e:
+            self.print_status(f"Failed to save columnar results: {e}", "error")
+
+
+def apply_settings(parser, settings):
+    cache_mode = None
+
+    for name, value in settings.items():
+        if name == 'output':
+            # None is kept: it turns the results CSV off, as crawl() does by default.
+            parser.output_path = value
+            continue
+        if value is None:
+            continue
+
+        if name == 'cache':
+            cache_mode = value
+        elif name == 'stream':
+            parser.streaming = bool(value)
+        elif name == 'checkpoint':
+            parser.checkpoint_path = value
+        elif name == 'columnar':
+            parser.columnar_path = value
+        elif name == 'history':
+            parser.history_path = value or None
+        elif name == 'metrics_json':
+            parser.metrics_json_path = value
+        elif name == 'metrics_prom':
+            parser.metrics_prom_path = value
+        elif name == 'sessions':
+            parser.session_configs = value
+        elif name == 'max_body_mb':
+            parser.max_body_bytes = int(value * 1024 * 1024)
+        elif name in SETTINGS:
+            setattr(parser, name, value)
+        else:
+            raise ValueError(f"Unknown setting: {name}")
+
+    if (parser.streaming or parser.online) and parser.output_path is None:
+        raise ValueError("Streaming and online mode need an output CSV")
+
+    if parser.telegram_token and parser.telegram_chat_id:
+        parser.telegram_enabled = True
+
+    if cache_mode not in (None, 'off'):
+        parser.enable_cache(offline=(cache_mode == 'offline'))
+
+
+SETTINGS = {
+    'concurrency', 'parse_workers', 'global_rate', 'host_rate', 'api_base', 'cache_path', 'cache_max_bytes',
+    'checkpoint_every', 'pool_size', 'connect_timeout', 'read_timeout', 'max_retries', 'backoff_base', 'backoff_cap',
+    'retry_after_cap', 'breaker_threshold', 'breaker_cooldown', 'telegram_token', 'telegram_chat_id', 'telegram_api',
+    'ai_threshold', 'growth_threshold', 'enrich_top', 'enrich_budget', 'enrich_ttl', 'online', 'notify_warmup',
+    'notify_margin', 'notify_quantile', 'max_body_bytes', 'incremental', 'proxies', 'session_rate', 'api_rate',
+    'html_rate', 'dedup', 'dedup_threshold', 'dedup_max', 'quiet',
+}
+
+
+def crawl(urls, max_pages=50, quiet=True, output=None, cache='on', **settings):
+    """Crawl category URLs and return their channels ranked by score, best first.
+
+    Results are only written to disk when `output` names a CSV file; pass
+    history=False to skip the channel history database as well.
+    """
+    if isinstance(urls, str):
+        urls = read_urls(urls)
+    else:
+        urls = [normalize_url(url) for url in urls]
+
+    parser = TGStatCmdParser()
+    apply_settings(parser, dict(settings, quiet=quiet, output=output, cache=cache))
+
+    parser.new_run(urls, max_pages)
+    parser.run()
+    return parser.ranked
+
+
+def score(channels):
+    """Score Channel records in place and return them ranked, best first."""
+    scores = TGStatCmdParser().score_channels(channels)
+    return [channels[i] for i in rank_order(scores)]
+
 
-def main():
+def query(source, text=None, category=None, members=None, reach=None, citations=None, score=None, sort='score',
+          limit=20):
+    """Return crawled channels matching every filter, highest `sort` value first.
+
+    `source` is a results CSV, a columnar export, a history database, a list of
+    Channel records or a ChannelIndex; indexes built from files are reused by
+    later queries. Range filters are (low, high) tuples, either end may be None.
+    """
+    ranges = {name: bounds for name, bounds in
+              (('members', members), ('reach', reach), ('citations', citations), ('score', score)) if bounds}
+    return channel_index(source).query(text, category, ranges, sort, limit)
+
+
+def build_arg_parser():
+    arg_parser = argparse.ArgumentParser(
+        description="TGStat channel parser. Without URLs, --config or --resume it asks for settings interactively.",
+        epilog="Run 'main.py query --help' to search the channels of a finished crawl."
+    )
+    arg_parser.add_argument('urls', nargs='*',
+                            help="category URLs, comma-separated lists, or files with one URL per line")
+    arg_parser.add_argument('--config', help="JSON file with settings; command-line flags take precedence")
+    arg_parser.add_argument('--max-pages', type=int, help="maximum pages per category (default: 50)")
+    arg_parser.add_argument('--concurrency', type=int, help="concurrent page requests (default: 4)")
+    arg_parser.add_argument('--pool-size', type=int,
+                            help="keep-alive connections per host (default: max(10, concurrency))")
+    arg_parser.add_argument('--timeout', dest='read_timeout', type=float, help="read timeout in seconds (default: 30)")
+    arg_parser.add_argument('--max-retries', type=int,
+                            help="retries for 429/5xx responses and connection errors (default: 5)")
+    arg_parser.add_argument('--proxy', dest='proxies', action='append',
+                            help="send requests through this proxy; repeat for a pool of sessions, one per proxy")
+    arg_parser.add_argument('--session-rate', type=float, help="requests/s per session, 0 is unlimited (default: 0)")
+    arg_parser.add_argument('--api-rate', type=float, help="API requests/s per session, 0 is unlimited (default: 0)")
+    arg_parser.add_argument('--html-rate', type=float, help="HTML page requests/s per session, 0 is unlimited (default: 0)")
+    arg_parser.add_argument('--breaker-threshold', type=int,
+                            help="failures in a row before a host is paused (default: 5)")
+    arg_parser.add_argument('--breaker-cooldown', type=float,
+                            help="first pause for a failing host in seconds, doubles up to 300 (default: 30)")
+    arg_parser.add_argument('--max-body-mb', type=float,
+                            help="largest response body to download, after decompression, in MB (default: 10)")
+    arg_parser.add_argument('--parse-workers', type=int, help="HTML parse processes, 0 parses in-process")
+    arg_parser.add_argument('--incremental', action='store_true', default=None,
+                            help="parse HTML pages while they download, bypassing the response cache")
+    arg_parser.add_argument('--cache', choices=['on', 'off', 'offline'], help="response cache mode (default: on)")
+    arg_parser.add_argument('--cache-path', help="response cache file (default: tgstat_cache.sqlite)")
+    arg_parser.add_argument('--enrich', dest='enrich_top', type=int,
+                            help="look up reach and citations for this many top HTML-mode channels, 0 disables (default: 50)")
+    arg_parser.add_argument('--enrich-budget', type=int, help="most channel stat pages requested per run (default: 50)")
+    arg_parser.add_argument('--dedup', choices=['flag', 'drop', 'off'],
+                            help="near-duplicate channels: flag them with duplicate_of, drop them, or keep them (default: flag)")
+    arg_parser.add_argument('--dedup-threshold', type=float,
+                            help="estimated title/description similarity that makes two channels mirrors (default: 0.8)")
+    arg_parser.add_argument('--dedup-max', type=int,
+                            help="most channels tracked for near-duplicates, about 2 KB each "
+                                 "(default: 200000, 20000 with --stream)")
+    arg_parser.add_argument('--output', help="results CSV (default: tgstat_links.csv)")
+    arg_parser.add_argument('--columnar', help="also write results to a .parquet file or an Arrow IPC stream (.arrow), needs pyarrow")
+    arg_parser.add_argument('--history', help="per-run channel history database (default: tgstat_history.sqlite)")
+    arg_parser.add_argument('--no-history', dest='history', action='store_const', const=False,
+                            help="don't record channel history or compare with earlier runs")
+    arg_parser.add_argument('--growth-threshold', type=float,
+                            help="re-notify known channels that grew by this %% (default: 5)")
+    arg_parser.add_argument('--stream', action='store_true', default=None,
+                            help="score and write channels as pages arrive")
+    arg_parser.add_argument('--online', action='store_true', default=None,
+                            help="stream results and send notifications during the crawl")
+    arg_parser.add_argument('--notify-warmup', type=int,
+                            help="channels to see before in-crawl notifications start (default: 200)")
+    arg_parser.add_argument('--notify-margin', type=float,
+                            help="%% a channel must beat the in-crawl threshold by (default: 5)")
+    arg_parser.add_argument('--notify-quantile', type=float,
+                            help="notify channels above this score quantile (e.g. 0.99) instead of --ai-threshold")
+    arg_parser.add_argument('--telegram-token', default=os.environ.get('TGSTAT_BOT_TOKEN'),
+                            help="bot token for notifications (default: $TGSTAT_BOT_TOKEN)")
+    arg_parser.add_argument('--telegram-chat-id', default=os.environ.get('TGSTAT_CHAT_ID'),
+                            help="chat id for notifications (default: $TGSTAT_CHAT_ID)")
+    arg_parser.add_argument('--telegram-api', help="Bot API base URL (default: https://api.telegram.org)")
+    arg_parser.add_argument('--ai-threshold', type=int, help="notify channels this %% above average (default: 20)")
+    arg_parser.add_argument('--metrics-json', help="write a JSON run report with per-stage timings to this file")
+    arg_parser.add_argument('--metrics-prom', help="write run metrics in Prometheus textfile format to this file")
+    arg_parser.add_argument('--quiet', action='store_true', default=None, help="only print errors")
+    arg_parser.add_argument('--resume', action='store_true',
+                            help="continue the last interrupted crawl from its checkpoint")
+    arg_parser.add_argument('--checkpoint', help="checkpoint file (default: tgstat_checkpoint.json)")
+    return arg_parser
+
+
+def run_headless(args):
+    settings = {}
+    if args.config:
+        with open(args.config, encoding='utf-8') as f:
+            settings = json.load(f)
+
+    for name, value in vars(args).items():
+        if name not in ('urls', 'config', 'resume') and value is not None:
+            settings[name] = value
+
+    urls = [url for entry in args.urls for url in read_urls(entry)]
+    config_urls = settings.pop('urls', [])
+    if not urls:
+        urls = [normalize_url(url) for url in config_urls]
+    max_pages = settings.pop('max_pages', 50)
+    settings.setdefault('cache', 'on')
+
+    parser = TGStatCmdParser()
+    try:
+        apply_settings(parser, settings)
+    except ValueError as e:
+        parser.print_status(str(e), "error")
+        return 1
+    parser.print_header()
+
+    if args.resume:
+        if not parser.load_checkpoint():
+            return 1
+    elif not urls:
+        parser.print_status("No URL provided. Exiting.", "error")
+        return 1
+    else:
+        parser.new_run(urls, max_pages)
+
+    completed = parser.run(resume=args.resume)
+    return 0 if completed and parser.ranked else 1
+
+
+def parse_range(value):
+    low, _, high = value.partition(':')
+    try:
+        return (
+            parse_number(low) if low.strip() else None,
+            parse_number(high) if high.strip() else None,
+        )
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected LOW:HIGH, got {value!r}")
+
+
+def parse_number(value):
+    value = value.strip().upper()
+    if value[-1:] in ('K', 'M'):
+        return float(value[:-1]) * (1000 if value[-1] == 'K' else 1000000)
+    return float(value)
+
+
+def build_query_parser():
+    arg_parser = argparse.ArgumentParser(
+        prog='main.py query',
+        description="Search the channels of a finished crawl. Ranges are LOW:HIGH, either end may be empty "
+                    "and K/M suffixes are allowed, e.g. --members 20K:100K."
+    )
+    arg_parser.add_argument('source', nargs='?', default="tgstat_links.csv",
+                            help="results CSV, .parquet/.arrow export or history .sqlite (default: tgstat_links.csv)")
+    arg_parser.add_argument('--text', help="words that must all appear in the title or description "
+                                           "(a history .sqlite only stores titles)")
+    arg_parser.add_argument('--category', help="category name, case-insensitive")
+    arg_parser.add_argument('--members', type=parse_range, help="subscriber range")
+    arg_parser.add_argument('--reach', type=parse_range, help="average post reach range")
+    arg_parser.add_argument('--citations', type=parse_range, help="citation range")
+    arg_parser.add_argument('--score', type=parse_range, help="quality score range")
+    arg_parser.add_argument('--sort', choices=QUERY_COLUMNS, default='score', help="sort column (default: score)")
+    arg_parser.add_argument('--limit', type=int, default=20, help="channels to show (default: 20)")
+    arg_parser.add_argument('--json', action='store_true', help="print results as JSON")
+    return arg_parser
+
+
+def run_query(args):
+    try:
+        start = time.perf_counter()
+        index = channel_index(args.source)
+        built = time.perf_counter()
+
+        ranges = {name: getattr(args, name) for name in QUERY_RANGES if getattr(args, name)}
+        rows = index.match(args.text, args.category, ranges)
+        channels = index.top(rows, args.sort, args.limit)
+        done = time.perf_counter()
+    except (OSError, ImportError, ValueError, KeyError, sqlite3.Error) as e:
+        print(f"Query failed: {e}", file=sys.stderr)
+        return 1
+
+    if args.json:
+        print(json.dumps([channel.to_dict() for channel in channels], ensure_ascii=False, indent=2))
+        return 0
+
+    print(f"{len(rows):,} of {len(index):,} channels match "
+          f"(index {built - start:.2f}s, query {(done - built) * 1000:.1f}ms)")
+    for i, channel in enumerate(channels):
+        score = f"{channel.score:.1f}" if channel.score is not None else '-'
+        print(f"{i + 1}. {channel.text} - Score: {score}/100")
+        print(f"   URL: {channel.url}")
+        print(f"   Subscribers: {channel.members_label()}, reach: {channel.avg_post_reach}, "
+              f"citations: {channel.citations}, engagement: {channel.engagement_rate():.1f}%")
+        if channel.category:
+            print(f"   Category: {channel.category}")
+    return 0
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == 'query':
+        return run_query(build_query_parser().parse_args(argv[1:]))
+
+    args = build_arg_parser().parse_args(argv)
+
+    import colorama
     colorama.init()
 
+    if args.urls or args.config or args.resume:
+        try:
+            return run_headless(args)
+        except KeyboardInterrupt:
+            print("\nProgram terminated by user.")
+            return 130
+        finally:
+            print(Style.RESET_ALL, end='')
+
     try:
         parser = TGStatCmdParser()
+        if args.checkpoint:
+            parser.checkpoint_path = args.checkpoint
         parser.start_parsing()
     except KeyboardInterrupt:
         print("\nProgram terminated by user.")
@@ -550,6 +4316,8 @@ def main():
         print(Style.RESET_ALL)
         input("\nPress Enter to exit...")
 
+    return 0
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
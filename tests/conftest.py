@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark  # noqa: E402
+
+
+@pytest.fixture
+def replay():
+    # The benchmark fixtures served locally, two pages per category.
+    server = benchmark.ReplayServer(benchmark.load_fixtures(), 2).start()
+    try:
+        yield server
+    finally:
+        server.stop()
@@ -0,0 +1,57 @@
+import main
+
+DESCRIPTION = "daily crypto market news, trading signals and exchange reviews for beginners"
+
+
+def channel(n, title, description='', score=50.0):
+    return main.Channel(f"https://t.me/chan{n}", title, members=1000, description=description, score=score)
+
+
+def test_mirrors_point_at_best_scoring_channel():
+    channels = [
+        channel(0, "Crypto Daily", DESCRIPTION, score=40),
+        channel(1, "Crypto Daily", DESCRIPTION + " 2", score=70),
+        channel(2, "Crypto Daily", DESCRIPTION, score=55),
+        channel(3, "Football Weekly", "match reports, transfer rumours and league tables every weekend"),
+    ]
+    parser = main.TGStatCmdParser()
+    parser.duplicates = main.NearDuplicates()
+
+    parser.mark_duplicates(channels)
+
+    assert [c.duplicate_of for c in channels] == [
+        "https://t.me/chan1", None, "https://t.me/chan1", None
+    ]
+    assert parser.mirror_count == 2
+
+
+def test_link_text_alone_never_clusters():
+    channels = [channel(n, "Subscribe to channel") for n in range(5)]
+    parser = main.TGStatCmdParser()
+    parser.duplicates = main.NearDuplicates()
+
+    parser.mark_duplicates(channels)
+
+    assert all(c.duplicate_of is None for c in channels)
+
+
+def test_tracking_stops_at_max_channels():
+    duplicates = main.NearDuplicates(max_channels=2)
+    channels = [channel(n, "Crypto Daily", DESCRIPTION) for n in range(4)]
+
+    for c in channels:
+        duplicates.add(c)
+
+    assert duplicates.full
+    assert [duplicates.best_url(c) for c in channels] == ["https://t.me/chan0"] * 2 + [None] * 2
+
+
+def test_streaming_tracks_fewer_channels_unless_told_otherwise():
+    parser = main.TGStatCmdParser()
+    assert parser.dedup_limit() == main.DEDUP_MAX_CHANNELS
+
+    main.apply_settings(parser, {'stream': True, 'output': 'links.csv'})
+    assert parser.dedup_limit() == main.DEDUP_STREAM_MAX_CHANNELS
+
+    main.apply_settings(parser, {'dedup_max': 50000})
+    assert parser.dedup_limit() == 50000
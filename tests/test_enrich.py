@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+import benchmark
+import main
+
+
+def crawl_kinds(replay, tmp_path, kinds, **settings):
+    urls = [f"{replay.base_url}/ru/tag/{kind}" for kind in kinds]
+    return main.crawl(urls, max_pages=3, api_base=replay.base_url, cache_path=str(tmp_path / 'cache.sqlite'),
+                      history=False, checkpoint=str(tmp_path / 'checkpoint.json'), **settings)
+
+
+def test_streamed_enrichment_runs_off_the_event_loop(replay, tmp_path, monkeypatch):
+    calls = []
+    enrich_channels = main.TGStatCmdParser.enrich_channels
+
+    def recording(self, channels, min_score=None):
+        try:
+            asyncio.get_running_loop()
+            calls.append('loop')
+        except RuntimeError:
+            calls.append('thread')
+        return enrich_channels(self, channels, min_score)
+
+    monkeypatch.setattr(main.TGStatCmdParser, 'enrich_channels', recording)
+
+    crawl_kinds(replay, tmp_path, ['cards', 'links'], stream=True, output=str(tmp_path / 'out.csv'))
+
+    assert calls
+    assert set(calls) == {'thread'}
+
+
+def test_api_channels_with_zero_stats_are_not_enriched(tmp_path, monkeypatch):
+    fixtures = benchmark.load_fixtures()
+    data = json.loads(fixtures['api'])
+    for item in data['items']:
+        item['avg_post_reach'] = item['citations'] = 0
+    fixtures['api'] = json.dumps(data).encode('utf-8')
+
+    requested = []
+    monkeypatch.setattr(main.TGStatCmdParser, 'fetch_channel_stats',
+                        lambda self, channel: requested.append(channel.url))
+
+    server = benchmark.ReplayServer(fixtures, 2).start()
+    try:
+        ranked = crawl_kinds(server, tmp_path, ['api'])
+    finally:
+        server.stop()
+
+    assert ranked
+    assert requested == []
+
+
+def test_metrics_cache_is_opened_once_per_run(replay, tmp_path, monkeypatch):
+    opened = []
+    cache_class = main.ChannelMetricsCache
+
+    def counting(*args):
+        opened.append(args)
+        return cache_class(*args)
+
+    monkeypatch.setattr(main, 'ChannelMetricsCache', counting)
+
+    crawl_kinds(replay, tmp_path, ['cards', 'links'], stream=True, output=str(tmp_path / 'out.csv'))
+
+    assert len(opened) == 1
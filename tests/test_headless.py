@@ -0,0 +1,29 @@
+import json
+
+import main
+
+
+def test_crawl_writes_no_csv_by_default(replay, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    ranked = main.crawl([f"{replay.base_url}/ru/tag/cards"], api_base=replay.base_url)
+
+    assert ranked
+    assert not list(tmp_path.glob('*.csv'))
+
+
+def test_crawl_writes_output_when_asked(replay, tmp_path):
+    output = tmp_path / 'out.csv'
+
+    main.crawl([f"{replay.base_url}/ru/tag/cards"], api_base=replay.base_url, output=str(output),
+               cache='off', history=False)
+
+    assert output.exists()
+
+
+def test_unknown_config_key_is_reported(tmp_path, capsys):
+    config = tmp_path / 'settings.json'
+    config.write_text(json.dumps({'urls': ['https://tgstat.ru/ru/tag/x'], 'no_such_setting': 1}))
+
+    assert main.main(['--config', str(config)]) == 1
+    assert 'Unknown setting: no_such_setting' in capsys.readouterr().out
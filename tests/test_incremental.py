@@ -0,0 +1,73 @@
+import http.server
+import threading
+
+import pytest
+
+import benchmark
+import main
+
+CARD = ('<div class="card channel-card"><a href="/channel/@privet_{n}">x</a>'
+        '<div class="channel-name">{title}</div><div class="channel-members">1.2K</div></div>')
+
+
+def page(title, head=''):
+    cards = ''.join(CARD.format(n=n, title=title) for n in range(3))
+    return f'<html><head>{head}</head><body><div class="row">{cards}</div></body></html>'
+
+
+PAGES = {
+    '/utf8': ('text/html', page('Привет мир').encode('utf-8')),
+    '/cp1251': ('text/html', page('Привет мир', '<meta charset="windows-1251">').encode('cp1251')),
+    '/header': ('text/html; charset=windows-1251', page('Привет мир').encode('cp1251')),
+}
+
+
+class PageHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        content_type, body = PAGES[self.path]
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def pages():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize('path', list(PAGES))
+def test_streamed_pages_use_declared_or_default_charset(pages, path):
+    parser = main.TGStatCmdParser()
+    parser.quiet = True
+
+    links, card_count, _ = parser.parse_streamed(pages + path, pages)
+
+    assert card_count == 3
+    assert {channel.text for channel in links} == {'Привет мир'}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 4096])
+def test_chunked_parse_matches_parse_page(chunk_size):
+    fixtures = benchmark.load_fixtures()
+    base_url = 'https://tgstat.ru/ru/tag/bench'
+    for kind in benchmark.HTML_FIXTURES:
+        content = benchmark.render(fixtures[kind], 1)
+        page_parser = main.IncrementalPageParser(base_url)
+        for offset in range(0, len(content), chunk_size):
+            page_parser.feed_bytes(content[offset:offset + chunk_size])
+        links, card_count = page_parser.finish()
+
+        expected, expected_cards = main.parse_page(content, base_url)
+        assert card_count == expected_cards
+        assert [(c.url, c.text, c.members) for c in links] == [(c.url, c.text, c.members) for c in expected]
@@ -0,0 +1,127 @@
+import http.server
+import json
+import threading
+import urllib.parse
+
+import pytest
+
+import main
+
+
+class BotHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8')
+        form = urllib.parse.parse_qs(body)
+
+        with server.lock:
+            server.requests += 1
+            limited = server.requests == 1
+            if not limited:
+                server.texts.append(form['text'][0])
+
+        if limited:
+            self.reply(429, {'ok': False, 'error_code': 429, 'parameters': {'retry_after': 1}})
+        else:
+            self.reply(200, {'ok': True, 'result': {}})
+
+    def reply(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def bot_api():
+    # Stand-in Bot API: the first sendMessage is rate limited, later ones succeed.
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), BotHandler)
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.texts = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def notifying_parser(bot_api):
+    parser = main.TGStatCmdParser()
+    main.apply_settings(parser, {
+        'telegram_token': 'TOKEN',
+        'telegram_chat_id': '42',
+        'telegram_api': f"http://127.0.0.1:{bot_api.server_address[1]}",
+        'output': None,
+    })
+    return parser
+
+
+def scored_channels(count):
+    channels = [
+        main.Channel(f"https://t.me/chan{n}", f"Channel <{n}> & co", members=150000, avg_post_reach=50000,
+                     citations=2000, description="x" * 300)
+        for n in range(count)
+    ]
+    main.score(channels)
+    return channels
+
+
+def test_notifications_are_digested_and_retried_after_429(bot_api, capsys):
+    parser = notifying_parser(bot_api)
+
+    for channel in scored_channels(40):
+        assert parser.notify_channel(channel, avg_score=40)
+    parser.flush_notifications()
+
+    out = capsys.readouterr().out
+    assert "Telegram rate limit hit, retrying in 1s" in out
+    assert "Sent 40 Telegram notifications" in out
+    assert sum(text.count("High-Quality Channel Found") for text in bot_api.texts) == 40
+    assert 1 < len(bot_api.texts) < 40
+    assert all(len(text) <= main.TELEGRAM_MESSAGE_LIMIT for text in bot_api.texts)
+    assert "Channel: <b>Channel &lt;0&gt; &amp; co</b>" in bot_api.texts[0]
+
+
+def test_long_analysis_is_trimmed_before_formatting(bot_api, monkeypatch):
+    parser = notifying_parser(bot_api)
+    channel = scored_channels(1)[0]
+    channel.url = "https://t.me/s/chan0?before=1&q=<b>"
+    monkeypatch.setattr(main.Channel, 'analysis', lambda self: ["Reach & citations <grew>"] * 400)
+    sent = []
+    monkeypatch.setattr(parser, 'send_telegram_message', sent.append)
+
+    parser.notify_channel(channel, avg_score=40)
+
+    message, = sent
+    assert len(message) <= main.TELEGRAM_MESSAGE_LIMIT
+    assert message.endswith("…")
+    assert message.count("<b>") == message.count("</b>") == 3
+    assert "&lt;grew&gt;" in message and "<grew>" not in message
+    assert "URL: https://t.me/s/chan0?before=1&amp;q=&lt;b&gt;\n" in message
+
+
+def test_online_final_report_waits_for_the_in_crawl_bar(replay, tmp_path, monkeypatch):
+    parser = main.TGStatCmdParser()
+    main.apply_settings(parser, {
+        'telegram_token': 'TOKEN', 'telegram_chat_id': '42', 'online': True, 'notify_warmup': 10000,
+        'ai_threshold': 0, 'cache': 'off', 'history': False, 'enrich_top': 0, 'quiet': True,
+        'api_base': replay.base_url, 'output': str(tmp_path / 'links.csv'),
+        'checkpoint': str(tmp_path / 'checkpoint.json'),
+    })
+    sent = []
+    monkeypatch.setattr(parser, 'send_telegram_message', sent.append)
+    parser.new_run([f"{replay.base_url}/ru/tag/cards"], 2)
+
+    assert parser.run()
+
+    # Under the offline rule these would have been notified; online mode never warmed up.
+    assert any(channel.score > parser.stream.average() for channel in parser.ranked)
+    assert parser.stream.online.bar() is None
+    assert sent == []
@@ -0,0 +1,48 @@
+import pytest
+
+import benchmark
+import main
+
+BASE_URL = 'https://tgstat.ru'
+
+
+def records(result):
+    links, card_count = result
+    return [(c.url, c.text, c.members, c.description, c.category) for c in links], card_count
+
+
+@pytest.mark.parametrize('kind', list(benchmark.HTML_FIXTURES))
+def test_soup_fallback_matches_lxml(kind, monkeypatch):
+    content = benchmark.render(benchmark.load_fixtures()[kind], 1)
+    with_lxml = records(main.parse_page(content, BASE_URL))
+
+    monkeypatch.setattr(main, 'lxml_xpaths', lambda: None)
+    without_lxml = records(main.parse_page(content, BASE_URL))
+
+    assert without_lxml == with_lxml
+    if kind == 'cards':
+        assert without_lxml[1] == 20
+
+
+def test_xml_declaration_with_encoding():
+    content = ('<?xml version="1.0" encoding="utf-8"?>\n<html><body>'
+               '<div class="card channel-card"><a href="/channel/@xml_chan">x</a>'
+               '<div class="channel-name">Канал</div></div></body></html>').encode('utf-8')
+
+    links, card_count = main.parse_page(content, BASE_URL)
+
+    assert card_count == 1
+    assert [(c.url, c.text) for c in links] == [('https://t.me/@xml_chan', 'Канал')]
+
+
+@pytest.mark.parametrize('url, username', [
+    ('https://t.me/Durov', 'durov'),
+    ('tgstat.ru/channel/@Durov', 'durov'),
+    ('https://t.me/joinchat/AbCdEf', '+AbCdEf'),
+    ('t.me/+AbCdEf', '+AbCdEf'),
+    ('https://t.me/+abcdef', '+abcdef'),
+    ('https://t.me/c/123456/78', 'c/123456'),
+    ('https://t.me/share/url?url=a', 't.me/share/url?url=a'),
+])
+def test_canonical_username_keeps_invites_and_private_ids(url, username):
+    assert main.canonical_username(url) == username
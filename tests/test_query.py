@@ -0,0 +1,66 @@
+import csv
+
+import pytest
+
+import main
+
+
+def write_results(path):
+    channels = [
+        main.Channel(f"https://t.me/chan{i}", f"Channel {i}", members=10000 * (i + 1), category='Crypto',
+                     avg_post_reach=500 * i, citations=20 * i)
+        for i in range(5)
+    ]
+    parser = main.TGStatCmdParser()
+    parser.quiet = True
+    parser.output_path = str(path)
+    parser.save_to_csv(main.score(channels))
+
+
+def test_csv_source_keeps_reach_and_citations(tmp_path):
+    path = tmp_path / 'results.csv'
+    write_results(path)
+
+    assert [c.username() for c in main.query(str(path), reach=(1000, None), sort='reach')] == \
+        ['chan4', 'chan3', 'chan2']
+    assert [c.citations for c in main.query(str(path), citations=(60, None), sort='citations')] == [80, 60]
+
+
+def test_old_csv_rejects_reach_filters(tmp_path):
+    path = tmp_path / 'results.csv'
+    write_results(path)
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        rows = [row[:main.CSV_FIELDS.index('avg_post_reach')] for row in csv.reader(f)]
+    old = tmp_path / 'old.csv'
+    with open(old, 'w', newline='', encoding='utf-8-sig') as f:
+        csv.writer(f).writerows(rows)
+
+    assert len(main.query(str(old), members=(20000, None))) == 4
+    with pytest.raises(ValueError):
+        main.query(str(old), reach=(1000, None))
+    with pytest.raises(ValueError):
+        main.query(str(old), sort='engagement')
+
+
+def test_index_is_saved_next_to_the_source_and_reused(tmp_path, monkeypatch):
+    np = pytest.importorskip('numpy')
+    path = tmp_path / 'results.csv'
+    write_results(path)
+    main.cached_index.cache_clear()
+    expected = [c.to_dict() for c in main.query(str(path), text='channel', members=(20000, None))]
+    assert (tmp_path / 'results.csv.index' / 'meta.json').exists()
+
+    main.cached_index.cache_clear()
+    monkeypatch.setattr(main, 'load_channels', lambda path: pytest.fail("index was rebuilt"))
+    index = main.channel_index(str(path))
+    assert isinstance(index.columns['members'], np.memmap)
+    assert [c.to_dict() for c in index.query('channel', ranges={'members': (20000, None)})] == expected
+    assert index.query(category='crypto', limit=None)[-1].username() == 'chan0'
+    assert index.query(text='missing') == []
+
+    monkeypatch.undo()
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        rows = list(csv.reader(f))[:3]
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        csv.writer(f).writerows(rows)
+    assert len(main.query(str(path), limit=None)) == 2
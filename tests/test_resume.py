@@ -0,0 +1,72 @@
+import csv
+
+import pytest
+
+import main
+
+
+def crawl(replay, directory, resume=False, **settings):
+    parser = main.TGStatCmdParser()
+    main.apply_settings(parser, dict(settings, cache='off', history=False, enrich_top=0, quiet=True, stream=True,
+                                     api_base=replay.base_url, output=str(directory / 'links.csv'),
+                                     checkpoint=str(directory / 'checkpoint.json')))
+    if resume:
+        assert parser.load_checkpoint()
+    else:
+        parser.new_run([f"{replay.base_url}/ru/tag/cards"], 2)
+    return parser.run(resume=resume)
+
+
+def streamed_urls(directory):
+    with open(directory / 'links.csv', newline='', encoding='utf-8-sig') as f:
+        return [row['url'] for row in csv.DictReader(f)]
+
+
+@pytest.fixture
+def expected(replay, tmp_path):
+    (tmp_path / 'full').mkdir()
+    assert crawl(replay, tmp_path / 'full')
+    return streamed_urls(tmp_path / 'full')
+
+
+def test_page_interrupted_before_storing_is_crawled_again(replay, tmp_path, expected, monkeypatch, capsys):
+    add = main.ResultStream.add
+    calls = []
+
+    def interrupted(self, channels):
+        calls.append(len(channels))
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        add(self, channels)
+
+    monkeypatch.setattr(main.ResultStream, 'add', interrupted)
+    assert not crawl(replay, tmp_path)
+
+    monkeypatch.setattr(main.ResultStream, 'add', add)
+    assert crawl(replay, tmp_path, resume=True)
+
+    assert "repeats an earlier page" not in capsys.readouterr().out
+    assert len(expected) > 0
+    assert sorted(streamed_urls(tmp_path)) == sorted(expected)
+
+
+def test_rows_streamed_after_the_last_checkpoint_are_not_repeated(replay, tmp_path, expected, monkeypatch):
+    mark_progress = main.TGStatCmdParser.mark_progress
+    save_checkpoint = main.TGStatCmdParser.save_checkpoint
+
+    def killed(self, url, mode, page, links=None):
+        # Page 2 is already in the CSV, but the process dies before it is checkpointed.
+        if page == 2:
+            monkeypatch.setattr(main.TGStatCmdParser, 'save_checkpoint', lambda self: None)
+            raise KeyboardInterrupt
+        mark_progress(self, url, mode, page, links)
+
+    monkeypatch.setattr(main.TGStatCmdParser, 'mark_progress', killed)
+    assert not crawl(replay, tmp_path, checkpoint_every=1)
+    assert len(streamed_urls(tmp_path)) == len(expected)
+
+    monkeypatch.setattr(main.TGStatCmdParser, 'mark_progress', mark_progress)
+    monkeypatch.setattr(main.TGStatCmdParser, 'save_checkpoint', save_checkpoint)
+    assert crawl(replay, tmp_path, resume=True, checkpoint_every=1)
+
+    assert sorted(streamed_urls(tmp_path)) == sorted(expected)
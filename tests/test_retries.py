@@ -0,0 +1,65 @@
+import socket
+
+import pytest
+
+import main
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run(url, tmp_path, **settings):
+    parser = main.TGStatCmdParser()
+    main.apply_settings(parser, dict(settings, cache='off', history=False, enrich_top=0, output=None,
+                                     checkpoint=str(tmp_path / 'checkpoint.json')))
+    parser.new_run([url], 2)
+    return parser, parser.run()
+
+
+def test_unreachable_api_stops_without_html_fallback(tmp_path, capsys):
+    base = f"http://127.0.0.1:{closed_port()}"
+
+    parser, completed = run(f"{base}/ru/tag/crypto", tmp_path, api_base=base, max_retries=1, backoff_base=0.01)
+
+    out = capsys.readouterr().out
+    assert not completed
+    assert "API unreachable after retries, stopping at page 1" in out
+    assert "switching to regular parsing" not in out
+    assert parser.resume_point(f"{base}/ru/tag/crypto") == ('api', 1)
+
+
+def test_oversized_page_is_not_reported_as_retried(replay, tmp_path, capsys):
+    _, completed = run(f"{replay.base_url}/ru/tag/cards", tmp_path, api_base=replay.base_url, max_body_mb=0.001)
+
+    out = capsys.readouterr().out
+    assert not completed
+    assert "Page 1 failed:" in out
+    assert "after retries" not in out
+
+
+@pytest.mark.parametrize('kinds', [['cards'], ['cards', 'links']])
+def test_offline_api_miss_falls_back_to_cached_html(replay, tmp_path, capsys, kinds):
+    urls = [f"{replay.base_url}/ru/tag/{kind}" for kind in kinds]
+    settings = dict(history=False, enrich_top=0, output=None, api_base=replay.base_url,
+                    cache_path=str(tmp_path / 'cache.db'), checkpoint=str(tmp_path / 'checkpoint.json'))
+
+    online = main.TGStatCmdParser()
+    main.apply_settings(online, dict(settings, cache='on'))
+    online.new_run(urls, 2)
+    assert online.run()
+    capsys.readouterr()
+
+    requests = replay.requests
+    offline = main.TGStatCmdParser()
+    main.apply_settings(offline, dict(settings, cache='offline'))
+    offline.new_run(urls, 2)
+
+    assert offline.run()
+    out = capsys.readouterr().out
+    assert "after retries" not in out
+    assert "not cached (offline mode)" in out
+    assert replay.requests == requests
+    assert sorted(c.url for c in offline.links) == sorted(c.url for c in online.links)
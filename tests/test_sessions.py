@@ -0,0 +1,104 @@
+import http.server
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+import main
+
+DIRECT = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+
+class ProxyHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+
+        if server.broken:
+            status, body = 502, b'bad gateway'
+        else:
+            try:
+                with DIRECT.open(self.path) as response:
+                    status, body = response.status, response.read()
+            except urllib.error.HTTPError as e:
+                status, body = e.code, e.read()
+
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def proxies():
+    # Stand-in HTTP proxies; a broken one answers every request with 502.
+    servers = []
+
+    def start(broken=False):
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ProxyHandler)
+        server.daemon_threads = True
+        server.lock = threading.Lock()
+        server.requests = 0
+        server.broken = broken
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def pool(count, **rates):
+    return main.SessionPool([main.PooledSession(f"s{n}", None, **rates) for n in range(count)])
+
+
+def test_least_loaded_session_is_picked():
+    sessions = pool(3)
+    breaker = main.CircuitBreaker()
+
+    first, second, third = (sessions.acquire('host', 'html', breaker) for _ in range(3))
+    assert len({first.name, second.name, third.name}) == 3
+
+    sessions.release(second)
+    assert sessions.acquire('host', 'html', breaker) is second
+
+
+def test_endpoint_buckets_are_separate():
+    sessions = pool(1, endpoint_rates={'api': 5})
+    breaker = main.CircuitBreaker()
+
+    sessions.acquire('host', 'api', breaker)
+    start = time.monotonic()
+    sessions.acquire('host', 'html', breaker)
+    assert time.monotonic() - start < 0.05
+
+    sessions.acquire('host', 'api', breaker)
+    assert time.monotonic() - start >= 0.15
+
+
+def test_failing_proxy_is_quarantined(replay, proxies, tmp_path, capsys):
+    good = [proxies(), proxies()]
+    broken = proxies(broken=True)
+    urls = [f"{replay.base_url}/ru/tag/{kind}" for kind in ('cards', 'links')]
+
+    ranked = main.crawl(
+        urls, max_pages=3, api_base=replay.base_url, cache='off', history=False, enrich_top=0, quiet=False,
+        proxies=[f"http://127.0.0.1:{server.server_address[1]}" for server in good + [broken]],
+        max_retries=3, backoff_base=0.01, breaker_threshold=2, breaker_cooldown=60,
+        checkpoint=str(tmp_path / 'checkpoint.json'),
+    )
+
+    assert len(ranked) == 80
+    assert "keeps failing on" in capsys.readouterr().out
+    assert broken.requests <= 3
+    assert all(server.requests > broken.requests for server in good)